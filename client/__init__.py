@@ -0,0 +1,18 @@
+"""
+Backend client for LightMix panels.
+
+    import asyncio
+    from client import PanelArray, Event
+
+    async def show():
+        async with PanelArray(["192.168.1.20", "192.168.1.21"]) as panels:
+            now = panels.clock()
+            events = [Event(start=now + 500 + i * 200, duration=200, color_end=color)
+                      for i, color in enumerate(("ff0000", "00ff00", "0000ff"))]
+            await panels.add_events(events)
+
+    asyncio.run(show())
+"""
+from client.event import Event, EASINGS, pack_queries, pack_records
+from client.panel import Panel, PanelError, backend_time
+from client.panel_array import PanelArray
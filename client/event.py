@@ -0,0 +1,141 @@
+from struct import pack
+
+# Easing curves, in firmware id order (see firmware/easing.py)
+EASINGS = (
+    "linear", "step", "easeInQuad", "easeOutQuad", "easeInOutQuad", "easeInCubic", "easeOutCubic",
+    "easeInOutCubic", "easeInQuart", "easeOutQuart", "easeInOutQuart", "easeInQuint", "easeOutQuint",
+    "easeInOutQuint", "easeInSine", "easeOutSine", "easeInOutSine", "easeInExpo", "easeOutExpo",
+    "easeInOutExpo", "easeInCirc", "easeOutCirc", "easeInOutCirc", "easeInBack", "easeOutBack",
+    "easeInOutBack", "easeInElastic", "easeOutElastic", "easeInOutElastic", "easeInBounce",
+    "easeOutBounce", "easeInOutBounce",
+)
+DEFAULT_EASING = EASINGS.index("easeInOutQuad")
+
+# Packed record, see firmware/event_queue.py
+RECORD_FORMAT = "<qL8BBB"
+RECORD_SIZE = 22
+FLAG_NOW = 1
+FLAG_KEEP_START = 2
+FLAG_KEEP_TARGET = 4
+
+# Firmware limit : request head (request line included), in bytes
+MAX_HEAD = 1024
+# /addevents bodies are streamed by the firmware, this one fills a whole queue (511 events)
+MAX_BODY = 11242
+
+
+class Event:
+    def __init__(self, start=None, duration=1, color_start=None, color_end=None, keylight=0, easing=None):
+        """
+        Color change event, as sent to /addevent or /addevents
+        :start: Int | start time (backend time, in milliseconds), None to start on receipt
+        :duration: Int | duration in milliseconds
+        :color_start: Str | hex color, 8, 24 or 32 bits, None to start from the current color
+        :color_end: Str | hex color, 8, 24 or 32 bits, None to keep the current color
+        :keylight: Float | white added to the mix, 1 adding as much white as the other channels
+        :easing: Str or Int | easing curve name or id, None for the firmware default
+        """
+        self.start = start
+        self.duration = duration
+        self.color_start = color_start
+        self.color_end = color_end
+        self.keylight = keylight
+        self.easing = easing
+
+    def __repr__(self):
+        return "Event({})".format(self.query())
+
+    def query(self):
+        """
+        :return: Str | /addevent parameters
+        """
+        parameters = []
+        if self.start is not None:
+            parameters.append("t={}".format(int(self.start)))
+        if self.color_start is not None:
+            parameters.append("cs={}".format(self.color_start))
+        if self.color_end is not None:
+            parameters.append("ce={}".format(self.color_end))
+        parameters.append("d={}".format(int(self.duration)))
+        if self.keylight:
+            parameters.append("k={}".format(self.keylight))
+        if self.easing is not None:
+            parameters.append("e={}".format(self.easing))
+        return "&".join(parameters)
+
+    def rgbw(self, color):
+        """
+        Resolves a hex color to 8 bits RGBW, as the firmware does : 8 bits is white,
+        24 bits grays are turned to white, and keylight adds white
+        :color: Str | hex color
+        :return: List of 4 Int
+        """
+        value = color[:8]
+        if len(value) == 2:
+            value = "000000" + value
+        if len(value) == 6:
+            if value[0:2] == value[2:4] == value[4:6]:
+                value = "000000" + value[0:2]
+            else:
+                value += "00"
+        if len(value) != 8:
+            raise ValueError("Unsupported color {}".format(color))
+        rgbw = [int(value[i:i + 2], 16) for i in range(0, 8, 2)]
+        if self.keylight:
+            keylight = int(float(self.keylight) * 256)
+            rgbw[3] = min(255, rgbw[3] + (rgbw[0] + rgbw[1] + rgbw[2]) * keylight // 768)
+        return rgbw
+
+    def record(self):
+        """
+        :return: bytes | /addevents packed record
+        """
+        flags = 0
+        if self.start is None:
+            flags |= FLAG_NOW
+        if self.color_start is None:
+            flags |= FLAG_KEEP_START
+        if self.color_end is None:
+            flags |= FLAG_KEEP_TARGET
+        start = [0] * 4 if self.color_start is None else self.rgbw(self.color_start)
+        end = [0] * 4 if self.color_end is None else self.rgbw(self.color_end)
+        easing = self.easing
+        if easing is None:
+            easing = DEFAULT_EASING
+        elif not isinstance(easing, int):
+            easing = EASINGS.index(easing)
+        return pack(RECORD_FORMAT, int(self.start or 0), int(self.duration), *start, *end, flags, easing)
+
+
+def pack_queries(events, budget):
+    """
+    Chains events with "&&" into as few /addevent queries as possible
+    :events: Iterable of Event
+    :budget: Int | maximum query length, in bytes
+    :return: List of Str
+    """
+    queries = []
+    current = ""
+    for event in events:
+        query = event.query()
+        if len(query) > budget:
+            raise ValueError("Event too large for a single request : {}".format(query))
+        if current and len(current) + 2 + len(query) > budget:
+            queries.append(current)
+            current = ""
+        current = current + "&&" + query if current else query
+    if current:
+        queries.append(current)
+    return queries
+
+
+def pack_records(events, budget=MAX_BODY):
+    """
+    Packs events into as few /addevents bodies as possible
+    :events: Iterable of Event
+    :budget: Int | maximum body size, in bytes
+    :return: List of bytes
+    """
+    per_body = budget // RECORD_SIZE
+    records = [event.record() for event in events]
+    return [b"".join(records[i:i + per_body]) for i in range(0, len(records), per_body)]
@@ -0,0 +1,269 @@
+import asyncio
+import json
+import time
+
+from client.event import MAX_HEAD, MAX_BODY, RECORD_SIZE, pack_queries, pack_records
+
+
+def backend_time():
+    """
+    Default backend clock, in unix milliseconds
+    """
+    return int(time.time() * 1000)
+
+
+class PanelError(Exception):
+    def __init__(self, panel, status, content):
+        super().__init__("{} answered {} : {}".format(panel, status, content))
+        self.panel = panel
+        self.status = status
+        self.content = content
+        # Admission control refusals (429, 503) : milliseconds before retrying
+        self.retry_after = content.get("retry_after") if isinstance(content, dict) else None
+        # Set by Panel.add_events : ids of the events handled before the failed request
+        self.ids = []
+
+
+class Panel:
+    def __init__(self, address, port=80, timeout=5, clock=backend_time):
+        """
+        A single LightMix, over a persistent HTTP connection.
+        Requests are sent one at a time, the connection is reopened when the panel closes it.
+        :address: Str | panel IP or hostname
+        :port: Int | HTTP port
+        :timeout: Float | seconds to wait for a response
+        :clock: Callable | backend time, in milliseconds
+        """
+        self.address = address
+        self.port = port
+        self.timeout = timeout
+        self.clock = clock
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+        # Last /sync exchange, sent with the next one
+        self._sample = None
+        # Clock state reported by the panel
+        self.offset = None
+        self.skew = None
+        self.delay = None
+        # Buffer state reported by the panel, updated by every response holding it
+        self.depth = None
+        self.buffered_until = None
+        self.free_events = None
+
+    def __repr__(self):
+        return "Panel({}:{})".format(self.address, self.port)
+
+    async def close(self):
+        writer = self._writer
+        self._reader = None
+        self._writer = None
+        if writer:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def _exchange(self, head, body):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.address, self.port), self.timeout)
+        self._writer.write(head + body)
+        await self._writer.drain()
+        response = await asyncio.wait_for(self._reader.readuntil(b"\r\n\r\n"), self.timeout)
+        lines = response.decode().split("\r\n")
+        status = int(lines[0].split()[1])
+        length = 0
+        close = False
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection":
+                close = value.strip().lower() == "close"
+        content = await asyncio.wait_for(self._reader.readexactly(length), self.timeout)
+        if close:
+            await self.close()
+        return status, content
+
+    async def request(self, path, method="GET", body=b""):
+        """
+        Sends a request, retrying once on a new connection if the kept-alive one was closed
+        :path: Str | path and query
+        :return: Dict | json response
+        Raises PanelError when the panel doesn't answer with a 2xx status
+        """
+        head = "{} {} HTTP/1.1\r\nHost: {}\r\n".format(method, path, self.address)
+        if body:
+            head += "Content-Length: {}\r\n".format(len(body))
+        head = (head + "\r\n").encode()
+        if len(head) > MAX_HEAD:
+            raise ValueError("Request head too large ({} bytes)".format(len(head)))
+
+        async with self._lock:
+            try:
+                status, content = await self._exchange(head, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # Kept-alive connection closed by the panel
+                await self.close()
+                status, content = await self._exchange(head, body)
+            except BaseException:
+                await self.close()
+                raise
+        try:
+            content = json.loads(content)
+        except ValueError:
+            content = content.decode(errors="replace")
+        if isinstance(content, dict) and "depth" in content:
+            self.depth = content["depth"]
+            self.buffered_until = content["buffered_until"]
+            self.free_events = content["free_events"]
+        if not 200 <= status < 300:
+            raise PanelError(self, status, content)
+        return content
+
+    async def sync(self):
+        """
+        NTP-style clock synchronisation (/sync). Each exchange sends the sample computed from
+        the previous one, the panel keeps the best samples and corrects its clock rate.
+        :return: Dict | panel response
+        """
+        t0 = self.clock()
+        path = "/sync?t0={}".format(t0)
+        if self._sample:
+            path += "&offset={}&delay={}&at={}".format(*self._sample)
+        response = await self.request(path)
+        t3 = self.clock()
+        t1, t2 = response["t1"], response["t2"]
+        offset = ((t0 - t1) + (t3 - t2)) // 2
+        delay = max(0, (t3 - t0) - (t2 - t1))
+        self._sample = (offset, delay, t1)
+        self.offset = response["offset"]
+        self.skew = response["skew"]
+        self.delay = response["delay"]
+        return response
+
+    async def calibrate(self, exchanges=4):
+        """
+        Synchronises the panel clock from scratch : a rough /calibrate, then a few /sync exchanges
+        :exchanges: Int | number of /sync exchanges
+        """
+        self._sample = None
+        await self.request("/calibrate?current_time={}".format(self.clock()))
+        for _ in range(exchanges):
+            await self.sync()
+
+    def head_budget(self, path):
+        """
+        Query length left in a request head, for a given path
+        """
+        overhead = len("GET {}? HTTP/1.1\r\nHost: {}\r\n\r\n".format(path, self.address))
+        return MAX_HEAD - overhead
+
+    async def add_events(self, events, binary=True):
+        """
+        Queues events, in as few requests as possible
+        :events: List of Event
+        :binary: Boolean | use /addevents packed records, else chain /addevent queries with "&&"
+        :return: List of Int | event ids, 0 for rejected events.
+          With binary, ids are consecutive unless other clients add events at the same time
+        Raises PanelError when a request fails, e.g. refused by a full queue. Its ids hold the ids
+        of the events sent before that request, in order ; the following events weren't queued
+        """
+        ids = []
+        try:
+            if binary:
+                for body in pack_records(events, MAX_BODY):
+                    response = await self.request("/addevents", "POST", body)
+                    count = len(body) // RECORD_SIZE
+                    first = response["first_id"]
+                    if first and response["success"]:
+                        ids.extend(range(first, first + count))
+                    else:
+                        # Rejections aren't reported per event
+                        ids.extend([0] * count)
+            else:
+                for query in pack_queries(events, self.head_budget("/addevent")):
+                    response = await self.request("/addevent?" + query)
+                    ids.extend(response["ids"])
+        except PanelError as error:
+            error.ids = ids
+            raise
+        return ids
+
+    async def cancel(self, event_id=None, start=None, end=None):
+        """
+        Cancels an event by id, or every event starting in [start, end[
+        """
+        if event_id is not None:
+            return await self.request("/cancel?id={}".format(event_id))
+        return await self.request("/cancel?from={}&to={}".format(int(start), int(end)))
+
+    async def wandering(self, min_ms, max_ms, idle_min_ms, idle_max_ms, min_c, max_c):
+        return await self.request(
+            "/wandering?min_ms={}&max_ms={}&idle_min_ms={}&idle_max_ms={}&min_c={}&max_c={}".format(
+                min_ms, max_ms, idle_min_ms, idle_max_ms, min_c, max_c))
+
+    async def delall(self):
+        return await self.request("/delall")
+
+    async def stats(self):
+        return await self.request("/stats")
+
+    async def status(self):
+        """
+        Buffer state : depth, buffered_until, horizon and remaining capacity (/status)
+        """
+        return await self.request("/status")
+
+    async def stream(self, events, lead=5000, interval=0.5, binary=True):
+        """
+        Streams a show just in time : events are sent once they start within lead milliseconds,
+        so the panel only buffers lead milliseconds of the show, whatever its length.
+        Batches are cut to the capacity reported by the panel, and refused batches are retried
+        after the panel's retry hint.
+        :events: Iterable of Event | sorted by start time (backend time), start is required
+        :lead: Int | milliseconds buffered ahead of playback
+        :interval: Float | longest wait between top-ups, in seconds
+        :binary: Boolean | see add_events
+        :return: Int | number of queued events
+        """
+        events = iter(events)
+        upcoming = next(events, None)
+        pending = []
+        queued = 0
+        await self.status()
+        while pending or upcoming is not None:
+            until = self.clock() + lead
+            while upcoming is not None and upcoming.start < until:
+                pending.append(upcoming)
+                upcoming = next(events, None)
+
+            if pending:
+                batch = pending[:self.free_events] if self.free_events is not None else pending
+                if not batch:
+                    # Full queue, waiting for events to start
+                    await asyncio.sleep(interval)
+                    await self.status()
+                    continue
+                try:
+                    ids = await self.add_events(batch, binary)
+                except PanelError as error:
+                    if error.retry_after is None:
+                        raise
+                    # Events queued before the refusal aren't sent again
+                    queued += len(error.ids) - error.ids.count(0)
+                    del pending[:len(error.ids)]
+                    await asyncio.sleep(min(error.retry_after / 1000, interval))
+                    continue
+                queued += len(ids) - ids.count(0)
+                del pending[:len(batch)]
+                continue
+
+            # Waiting for the next event to come within the lead time
+            wait = (upcoming.start - lead - self.clock()) / 1000
+            await asyncio.sleep(min(max(wait, 0), interval))
+        return queued
@@ -0,0 +1,149 @@
+import asyncio
+import socket
+from struct import pack
+
+from client.event import pack_records, RECORD_SIZE
+from client.panel import Panel, backend_time
+
+# UDP control channel, see firmware/udp.py
+UDP_PORT = 4210
+UDP_GROUP = "239.76.77.1"
+UDP_HEADER = b"LM\x01"
+UDP_SECTION_FORMAT = "<BBBH"
+UDP_SECTION_SIZE = 5
+UDP_ADDEVENT = 1
+UDP_DELALL = 2
+ALL_PANELS = 0xFF
+# Datagram size that avoids IP fragmentation on ethernet and wifi
+UDP_MAX_DATAGRAM = 1472
+
+
+class PanelArray:
+    def __init__(self, addresses, port=80, sync_interval=60, timeout=5, clock=backend_time):
+        """
+        Every panel of a show. Commands are sent to all panels concurrently, so they land
+        at the same time instead of rippling across the array. Clocks are kept in sync in the background.
+
+            async with PanelArray(["192.168.1.20", "192.168.1.21"]) as panels:
+                await panels.add_events([Event(start=panels.clock() + 500, color_end="ff", duration=1000)])
+
+        :addresses: List of Str | panels IP or hostname
+        :port: Int | HTTP port
+        :sync_interval: Float | seconds between background /sync rounds, None to disable
+        :timeout: Float | seconds to wait for a response
+        :clock: Callable | backend time, in milliseconds
+        """
+        self.panels = [Panel(address, port, timeout, clock) for address in addresses]
+        self.sync_interval = sync_interval
+        self.clock = clock
+        self._sync_task = None
+        self._udp = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def start(self):
+        """
+        Calibrates every panel, then starts the background synchronisation
+        """
+        await self.calibrate()
+        if self.sync_interval:
+            self._sync_task = asyncio.create_task(self._sync_loop())
+
+    async def close(self):
+        if self._sync_task:
+            self._sync_task.cancel()
+            self._sync_task = None
+        if self._udp:
+            self._udp.close()
+            self._udp = None
+        await asyncio.gather(*(panel.close() for panel in self.panels))
+
+    async def gather(self, command, *args, **kwargs):
+        """
+        Runs a Panel method on every panel concurrently
+        :command: Str | Panel method name
+        :return: List | results by panel. Failed panels give their exception instead of failing the others
+        """
+        return await asyncio.gather(*(getattr(panel, command)(*args, **kwargs) for panel in self.panels),
+                                    return_exceptions=True)
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.gather("sync")
+
+    async def calibrate(self, exchanges=4):
+        return await self.gather("calibrate", exchanges)
+
+    async def sync(self):
+        return await self.gather("sync")
+
+    async def add_events(self, events, binary=True):
+        """
+        Queues the same events on every panel
+        :return: List | event ids by panel, see Panel.add_events
+        """
+        return await self.gather("add_events", events, binary)
+
+    async def add_events_by_panel(self, events):
+        """
+        Queues different events on each panel, concurrently
+        :events: List of List of Event | events by panel, in panels order
+        :return: List | event ids by panel, an empty list for panels without events
+        """
+        return await asyncio.gather(*(self._add_panel_events(panel, panel_events)
+                                      for panel, panel_events in zip(self.panels, events)),
+                                    return_exceptions=True)
+
+    @staticmethod
+    async def _add_panel_events(panel, events):
+        if not events:
+            return []
+        return await panel.add_events(events)
+
+    async def cancel(self, event_id=None, start=None, end=None):
+        return await self.gather("cancel", event_id, start, end)
+
+    async def wandering(self, *args):
+        return await self.gather("wandering", *args)
+
+    async def delall(self):
+        return await self.gather("delall")
+
+    async def stats(self):
+        return await self.gather("stats")
+
+    async def status(self):
+        return await self.gather("status")
+
+    async def stream(self, events, lead=5000, interval=0.5, binary=True):
+        """
+        Streams the same events to every panel just in time, see Panel.stream
+        :events: List of Event | sorted by start time, iterated once per panel
+        :return: List | number of queued events by panel
+        """
+        return await self.gather("stream", events, lead, interval, binary)
+
+    def multicast(self, events, group=UDP_GROUP, port=UDP_PORT):
+        """
+        Sends events to every panel at once through the UDP control channel.
+        A single datagram reaches the whole array, but delivery isn't acknowledged :
+        send events ahead of time, or resend them.
+        :events: List of Event
+        :return: Int | number of datagrams sent
+        """
+        if self._udp is None:
+            self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._udp.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        budget = (UDP_MAX_DATAGRAM - len(UDP_HEADER) - UDP_SECTION_SIZE) // RECORD_SIZE * RECORD_SIZE
+        sent = 0
+        for payload in pack_records(events, budget):
+            section = pack(UDP_SECTION_FORMAT, UDP_ADDEVENT, ALL_PANELS, 0, len(payload))
+            self._udp.sendto(UDP_HEADER + section + payload, (group, port))
+            sent += 1
+        return sent
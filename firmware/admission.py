@@ -0,0 +1,91 @@
+import gc
+
+# Admission results
+ADMITTED = 0
+QUEUE_FULL = 429
+LOW_MEMORY = 503
+TOO_LARGE = 413
+
+
+class Admission:
+    def __init__(self, lightmix, max_events=None, reserve=16384, retry=1000):
+        """
+        Admission control of new events.
+        Requests adding events are checked as a whole before anything is queued : they are refused
+        when the queue can't take all of their events, or when the heap is short, instead of being
+        partially dropped. Refusals come with a retry hint, so backends can throttle themselves.
+
+        :lightmix: LightMix
+        :max_events: Int | queued events limit, the queue capacity if None
+        :reserve: Int | free heap bytes kept for the tick loop and the network stack
+        :retry: Int | retry hint when the heap is short, in milliseconds
+        """
+        self.lightmix = lightmix
+        self.max_events = min(max_events or lightmix.queue.capacity, lightmix.queue.capacity)
+        self.reserve = reserve
+        self.retry = retry
+        # Counters
+        self.refused = 0  # refused requests
+        self.refused_events = 0
+
+    def free_events(self):
+        """
+        :return: Int | events that can still be queued
+        """
+        return max(0, self.max_events - len(self.lightmix.queue))
+
+    def free_memory(self):
+        """
+        :return: Int | free heap bytes over the reserve
+        """
+        return max(0, gc.mem_free() - self.reserve)
+
+    def retry_after(self, needed):
+        """
+        Time before enough queue slots are freed : queued events free their slot when they start
+        :needed: Int | missing slots
+        :return: Int | milliseconds
+        """
+        clock = self.lightmix.clock
+        start = self.lightmix.queue.start_at(needed - 1)
+        if start is None:
+            return self.retry
+        return max(0, start - clock.timeline(clock.now()))
+
+    def check(self, count):
+        """
+        Checks whether events can be queued
+        :count: Int | number of events to add
+        :return: Tuple (result, retry_after) | ADMITTED, QUEUE_FULL, LOW_MEMORY or TOO_LARGE (never fits),
+          and the retry hint in milliseconds
+        """
+        result = ADMITTED
+        retry_after = 0
+        if count > self.max_events:
+            result = TOO_LARGE
+        elif gc.mem_free() < self.reserve:
+            # Garbage may be the only thing in the way
+            gc.collect()
+            if gc.mem_free() < self.reserve:
+                result = LOW_MEMORY
+                retry_after = self.retry
+        if result == ADMITTED and count > self.free_events():
+            result = QUEUE_FULL
+            retry_after = self.retry_after(count - self.free_events())
+        if result != ADMITTED:
+            self.refused += 1
+            self.refused_events += count
+        return result, retry_after
+
+    def status(self):
+        """
+        Buffer state and remaining capacity, reported to backends :
+        queued events, end of the buffered events (client time, None if nothing is scheduled), free events and memory
+        :return: Dict
+        """
+        return {
+            "depth": len(self.lightmix.queue),
+            "buffered_until": self.lightmix.buffered_until(),
+            "free_events": self.free_events(),
+            "free_memory": self.free_memory()
+        }
@@ -0,0 +1,183 @@
+import time
+from array import array
+
+# Maximum accepted skew, in parts per billion (500 ppm, as NTP)
+MAX_SKEW = 500000
+
+
+class ClockSync:
+    def __init__(self, window=8, min_span=10000):
+        """
+        Client timeline, synchronised NTP-style.
+        Keeps a filtered offset beetween the client clock and the local clock,
+        plus a skew estimate used to correct the local clock rate.
+
+        Client times are large numbers (unix milliseconds). The tick loop works on
+        the timeline instead : client time minus an epoch, so it stays in small
+        integers and doesn't allocate on MicroPython.
+
+        :window: Int | number of sync samples kept
+        :min_span: Int | minimum duration (ms) covered by samples to estimate skew
+        """
+        self.window = window
+        self.min_span = min_span
+
+        # client = local + offset + (local - ref) * skew / 10^9
+        self.offset = 0
+        self.ref = 0
+        self.skew = 0  # parts per billion
+        self.delay = 0  # round trip delay of the sample in use
+
+        # timeline = client - epoch
+        self.epoch = 0
+
+        # Unwrapped local clock, ticks_ms wraps after a few days.
+        # [ticks, local], updated by the tick loop. _version is odd while updating
+        self._base = array("q", [time.ticks_ms(), 0])
+        self._version = 0
+
+        # Timeline at base : local + _shift + _correction, _remainder being the
+        # correction fraction (in 10^-9 ms), all kept small
+        self._shift = 0
+        self._correction = 0
+        self._remainder = 0
+
+        # Samples ring : local time, offset and round trip delay
+        self._sample_local = array("q", [0] * window)
+        self._sample_offset = array("q", [0] * window)
+        self._sample_delay = array("l", [0] * window)
+        self._count = 0
+        self._next = 0
+
+    def local(self):
+        """
+        Local monotonic time in milliseconds, unaffected by ticks_ms wrapping
+        as long as advance() is called at least once a day.
+        """
+        while True:
+            version = self._version
+            ticks = self._base[0]
+            local = self._base[1]
+            if version == self._version and not version & 1:
+                return local + time.ticks_diff(time.ticks_ms(), ticks)
+
+    def advance(self):
+        """
+        Moves the local clock base forward. Called by the tick loop only.
+        :return: Int | current timeline time
+        """
+        ticks = time.ticks_ms()
+        elapsed = time.ticks_diff(ticks, self._base[0])
+        self._version = (self._version + 1) & 0xFFFFFF
+        self._base[0] = ticks
+        self._base[1] += elapsed
+        self._version = (self._version + 1) & 0xFFFFFF
+
+        # Rate correction, accumulated step by step
+        self._remainder += elapsed * self.skew
+        if not 0 <= self._remainder < 1000000000:
+            carry = self._remainder // 1000000000
+            self._correction += carry
+            self._remainder -= carry * 1000000000
+        return self._base[1] + self._shift + self._correction
+
+    def now(self, local=None):
+        """
+        Current client time in milliseconds, rate corrected
+        :local: Int | local time to convert, current local time if None
+        """
+        if local is None:
+            local = self.local()
+        return local + self.offset + (local - self.ref) * self.skew // 1000000000
+
+    def timeline(self, client_time):
+        """
+        Converts a client time to the timeline
+        """
+        return client_time - self.epoch
+
+    def rebase(self):
+        """
+        Applies a new offset, reference or skew. The epoch follows the offset
+        when they get too far apart to keep the timeline small.
+        :return: Int | epoch change, to be substracted from stored timeline times
+        """
+        change = 0
+        if not -0x10000000 < self.offset - self.epoch < 0x10000000:
+            change = self.offset - self.epoch
+            self.epoch = self.offset
+
+        self._shift = self.offset - self.epoch
+        correction = (self._base[1] - self.ref) * self.skew
+        self._correction = correction // 1000000000
+        self._remainder = correction - self._correction * 1000000000
+        return change
+
+    def calibrate(self, client_time):
+        """
+        Sets the client time directly, ignoring request latency.
+        The skew estimate is kept, sync samples are dropped.
+        :client_time: Int | client time in milliseconds
+        :return: Int | epoch change, see rebase
+        """
+        self.ref = self.local()
+        self.offset = client_time - self.ref
+        self.delay = 0
+        self._count = 0
+        self._next = 0
+        return self.rebase()
+
+    def add_sample(self, local, offset, delay):
+        """
+        Adds an NTP-style sample computed by the client :
+        offset = ((t0 - t1) + (t3 - t2)) / 2 and delay = (t3 - t0) - (t2 - t1)
+        where t0/t3 are client send/receive times and t1/t2 local receive/send times.
+
+        :local: Int | local time of the sample (t1)
+        :offset: Int | client - local offset (ms)
+        :delay: Int | round trip delay (ms)
+        :return: Int | epoch change, see rebase
+        """
+        if delay < 0:
+            raise ValueError("Negative delay")
+        i = self._next
+        self._sample_local[i] = local
+        self._sample_offset[i] = offset
+        self._sample_delay[i] = delay
+        self._next = (i + 1) % self.window
+        self._count = min(self._count + 1, self.window)
+        self.filter()
+        return self.rebase()
+
+    def filter(self):
+        """
+        Clock filter : the sample with the lowest delay sets the offset,
+        samples with a low enough delay are used to estimate skew.
+        """
+        count = self._count
+        best = 0
+        for i in range(1, count):
+            if self._sample_delay[i] < self._sample_delay[best]:
+                best = i
+
+        # Skew, least squares over samples not much slower than the best one
+        max_delay = 2 * self._sample_delay[best] + 2
+        selected = [i for i in range(count) if self._sample_delay[i] <= max_delay]
+        if len(selected) >= 3:
+            locals_ = [self._sample_local[i] for i in selected]
+            span = max(locals_) - min(locals_)
+            if span >= self.min_span:
+                mean_x = sum(locals_) / len(selected)
+                mean_y = sum(self._sample_offset[i] for i in selected) / len(selected)
+                sxx = 0
+                sxy = 0
+                for i in selected:
+                    dx = self._sample_local[i] - mean_x
+                    sxx += dx * dx
+                    sxy += dx * (self._sample_offset[i] - mean_y)
+                skew = int(sxy / sxx * 1000000000)
+                self.skew = max(-MAX_SKEW, min(MAX_SKEW, skew))
+
+        self.ref = self._sample_local[best]
+        self.offset = self._sample_offset[best]
+        self.delay = self._sample_delay[best]
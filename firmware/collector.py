@@ -0,0 +1,82 @@
+import gc
+import time
+
+
+class SlackCollector:
+    def __init__(self, soft=50, hard=80, margin=2000):
+        """
+        Garbage collection scheduled in tick slack time.
+        Collections run between ticks, only when the time left before the next deadline
+        covers the expected pause and the heap use passed the soft limit.
+        gc.threshold is tuned after every collection so the allocator only collects
+        on its own (possibly mid-fade) when the soft limit couldn't be honoured.
+
+        :soft: Int | heap use (%) from which a collection is scheduled
+        :hard: Int | share (%) of the free heap that can be allocated before the allocator collects
+        :margin: Int | time (us) kept free after the expected pause
+        """
+        self.soft = soft
+        self.hard = hard
+        self.margin = margin
+
+        # Counters
+        self.collections = 0  # scheduled collections
+        self.automatic = 0  # collections triggered by the allocator
+        self.deferred = 0  # slacks too short while over the soft limit
+        self.pause = 0  # last pause, in microseconds
+        self.max_pause = 0
+        self.total_pause = 0
+
+        # Expected pause, following the longest recent pauses. Measured once at start
+        self.estimate = 0
+        self._limit = 0
+        self._allocated = 0
+        self.run()
+
+    def tune(self):
+        """
+        Fits gc.threshold to the heap left after a collection
+        """
+        free = gc.mem_free()
+        allocated = gc.mem_alloc()
+        gc.threshold(free * self.hard // 100)
+        # Leaving room to allocate when live data alone passes the soft limit
+        self._limit = max((free + allocated) * self.soft // 100, allocated + free // 4)
+
+    def collect(self, slack):
+        """
+        Collects if needed and possible. Called by the tick loop after every tick.
+        :slack: Int | time left before the next deadline, in microseconds
+        :return: Boolean | True if a collection ran
+        """
+        allocated = gc.mem_alloc()
+        if allocated < self._allocated:
+            # Freed without us : the allocator collected
+            self.automatic += 1
+            self.tune()
+        self._allocated = allocated
+        if allocated < self._limit:
+            return False
+        if slack < self.estimate + self.margin:
+            self.deferred += 1
+            return False
+        self.run()
+        return True
+
+    def run(self):
+        """
+        Collects now, timing the pause
+        """
+        start = time.ticks_us()
+        gc.collect()
+        pause = time.ticks_diff(time.ticks_us(), start)
+
+        self.collections += 1
+        self.pause = pause
+        self.total_pause += pause
+        if pause > self.max_pause:
+            self.max_pause = pause
+        # Decays slowly, so one quick collection doesn't underestimate the next
+        self.estimate = max(pause, self.estimate - (self.estimate >> 3))
+        self._allocated = gc.mem_alloc()
+        self.tune()
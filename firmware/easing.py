@@ -0,0 +1,143 @@
+from array import array
+from math import sin, cos, sqrt, pi
+
+# Fixed point scales
+SCALE = 16384  # Coefficient of 1
+PROGRESS = 65536  # Completion of 1
+
+# Table resolution : 64 segments per curve, interpolated linearly
+SEGMENT_BITS = 6
+SEGMENTS = 1 << SEGMENT_BITS
+_FRACTION_BITS = 16 - SEGMENT_BITS
+_FRACTION_MASK = (1 << _FRACTION_BITS) - 1
+
+
+def _bounce_out(t):
+    if t < 1 / 2.75:
+        return 7.5625 * t * t
+    elif t < 2 / 2.75:
+        t -= 1.5 / 2.75
+        return 7.5625 * t * t + 0.75
+    elif t < 2.5 / 2.75:
+        t -= 2.25 / 2.75
+        return 7.5625 * t * t + 0.9375
+    t -= 2.625 / 2.75
+    return 7.5625 * t * t + 0.984375
+
+
+_BACK = 1.70158
+_BACK_IN_OUT = _BACK * 1.525
+
+# Curves from https://github.com/danro/jquery-easing/blob/master/jquery.easing.js
+# t is the completion, beetween 0 and 1. Order matters : the index is the curve id
+CURVES = (
+    ("linear", lambda t: t),
+    ("step", lambda t: 0 if t < 1 else 1),
+    ("easeInQuad", lambda t: t * t),
+    ("easeOutQuad", lambda t: t * (2 - t)),
+    ("easeInOutQuad", lambda t: 2 * t * t if t < 0.5 else -1 + (4 - 2 * t) * t),
+    ("easeInCubic", lambda t: t ** 3),
+    ("easeOutCubic", lambda t: (t - 1) ** 3 + 1),
+    ("easeInOutCubic", lambda t: 4 * t ** 3 if t < 0.5 else 4 * (t - 1) ** 3 + 1),
+    ("easeInQuart", lambda t: t ** 4),
+    ("easeOutQuart", lambda t: 1 - (t - 1) ** 4),
+    ("easeInOutQuart", lambda t: 8 * t ** 4 if t < 0.5 else 1 - 8 * (t - 1) ** 4),
+    ("easeInQuint", lambda t: t ** 5),
+    ("easeOutQuint", lambda t: (t - 1) ** 5 + 1),
+    ("easeInOutQuint", lambda t: 16 * t ** 5 if t < 0.5 else 16 * (t - 1) ** 5 + 1),
+    ("easeInSine", lambda t: 1 - cos(t * pi / 2)),
+    ("easeOutSine", lambda t: sin(t * pi / 2)),
+    ("easeInOutSine", lambda t: (1 - cos(pi * t)) / 2),
+    ("easeInExpo", lambda t: 0 if t == 0 else 2 ** (10 * (t - 1))),
+    ("easeOutExpo", lambda t: 1 if t == 1 else 1 - 2 ** (-10 * t)),
+    ("easeInOutExpo", lambda t: 0 if t == 0 else 1 if t == 1 else
+        2 ** (20 * t - 10) / 2 if t < 0.5 else (2 - 2 ** (10 - 20 * t)) / 2),
+    ("easeInCirc", lambda t: 1 - sqrt(1 - t * t)),
+    ("easeOutCirc", lambda t: sqrt(1 - (t - 1) ** 2)),
+    ("easeInOutCirc", lambda t: (1 - sqrt(1 - 4 * t * t)) / 2 if t < 0.5 else
+        (sqrt(1 - (2 - 2 * t) ** 2) + 1) / 2),
+    ("easeInBack", lambda t: t * t * ((_BACK + 1) * t - _BACK)),
+    ("easeOutBack", lambda t: 1 + (t - 1) ** 2 * ((_BACK + 1) * (t - 1) + _BACK)),
+    ("easeInOutBack", lambda t: (2 * t) ** 2 * ((_BACK_IN_OUT + 1) * 2 * t - _BACK_IN_OUT) / 2 if t < 0.5 else
+        ((2 * t - 2) ** 2 * ((_BACK_IN_OUT + 1) * (2 * t - 2) + _BACK_IN_OUT) + 2) / 2),
+    ("easeInElastic", lambda t: t if t in (0, 1) else
+        -2 ** (10 * t - 10) * sin((10 * t - 10.75) * 2 * pi / 3)),
+    ("easeOutElastic", lambda t: t if t in (0, 1) else
+        2 ** (-10 * t) * sin((10 * t - 0.75) * 2 * pi / 3) + 1),
+    ("easeInOutElastic", lambda t: t if t in (0, 1) else
+        -2 ** (20 * t - 10) * sin((20 * t - 11.125) * 2 * pi / 4.5) / 2 if t < 0.5 else
+        2 ** (10 - 20 * t) * sin((20 * t - 11.125) * 2 * pi / 4.5) / 2 + 1),
+    ("easeInBounce", lambda t: 1 - _bounce_out(1 - t)),
+    ("easeOutBounce", _bounce_out),
+    ("easeInOutBounce", lambda t: (1 - _bounce_out(1 - 2 * t)) / 2 if t < 0.5 else
+        (1 + _bounce_out(2 * t - 1)) / 2),
+)
+
+NAMES = {name: i for i, (name, curve) in enumerate(CURVES)}
+DEFAULT = NAMES["easeInOutQuad"]
+
+
+def _build_table():
+    """
+    Samples every curve into a single table of SCALE based integers
+    """
+    table = array("h", [0] * (len(CURVES) * (SEGMENTS + 1)))
+    i = 0
+    for name, curve in CURVES:
+        for segment in range(SEGMENTS + 1):
+            table[i] = int(round(curve(segment / SEGMENTS) * SCALE))
+            i += 1
+    return table
+
+
+# Built once, at boot
+_table = _build_table()
+
+
+def ease(curve, progress):
+    """
+    Looks up a curve, interpolating beetween samples
+    :curve: Int | curve id
+    :progress: Int | completion beetween 0 and PROGRESS
+    :return: Int | easing coefficient, SCALE being 1
+    """
+    if progress >= PROGRESS:
+        return _table[curve * (SEGMENTS + 1) + SEGMENTS]
+    if progress <= 0:
+        return _table[curve * (SEGMENTS + 1)]
+    index = curve * (SEGMENTS + 1) + (progress >> _FRACTION_BITS)
+    low = _table[index]
+    return low + (((_table[index + 1] - low) * (progress & _FRACTION_MASK)) >> _FRACTION_BITS)
+
+
+def progress(elapsed, duration):
+    """
+    Completion of a duration, computed in small integers
+    :elapsed: Int | elapsed time
+    :duration: Int | total duration, positive
+    :return: Int | completion beetween 0 and PROGRESS
+    """
+    if elapsed >= duration:
+        return PROGRESS
+    if elapsed <= 0:
+        return 0
+    # Keeping elapsed * PROGRESS under 2^30
+    while duration > 0x3FFF:
+        elapsed >>= 1
+        duration >>= 1
+    return elapsed * PROGRESS // duration
+
+
+def curve_id(value):
+    """
+    Parses a curve name or id
+    :value: Str or Int | curve name (as in CURVES) or id
+    :return: Int | curve id
+    Raises ValueError if the curve doesn't exist
+    """
+    if value in NAMES:
+        return NAMES[value]
+    curve = int(value)
+    if not 0 <= curve < len(CURVES):
+        raise ValueError("Unknown easing {}".format(value))
+    return curve
@@ -1,79 +1,102 @@
+from array import array
+from easing import ease, progress, DEFAULT, SCALE
+from log import log, DEBUG
+
+# Channel value meaning "use the current color at event start"
+UNSET = -1
+
+
 class Event:
-  def __init__(self, start, duration=1000,
-               rgbwt_start={"r": None, "g": None, "b": None, "w": None},
-               rgbwt_target={"r": None, "g": None, "b": None, "w": None}
-               ):
+  __slots__ = ("id", "start", "duration", "easing", "active", "rgbw_start", "rgbw_target")
+
+  def __init__(self, start, duration=1000, rgbw_start=None, rgbw_target=None, easing=DEFAULT, event_id=0):
     """
     Color change Event. Will calculate colors and ease them for a LightMix object
     
-    :start: Int | Starting point. (in milliseconds since bootup)
+    :start: Int | Starting point. (in milliseconds, on the LightMix timeline)
     :duration: Int | duration in milliseconds
     
-    Next value can contains None. None will be replaced by current RGBW value at event start. 
-    :rgbwt_start:  Dict | Starting Red, green, blue, white and temperature 
-    :rgbwt_target: Dict | Targeted Red, green, blue, white and temperature 
-    
-    math provided by https://github.com/danro/jquery-easing/blob/master/jquery.easing.js
+    Next value can be None or contain UNSET channels, replaced by current RGBW value at event start. 
+    :rgbw_start:  Sequence of 4 Int | Starting Red, green, blue and white (10 bits)
+    :rgbw_target: Sequence of 4 Int | Targeted Red, green, blue and white (10 bits)
+    :easing: Int | easing curve id, see easing.CURVES
+    :event_id: Int | id given by the event queue
     
     """
+    self.rgbw_start = array("h", (UNSET, UNSET, UNSET, UNSET))
+    self.rgbw_target = array("h", (UNSET, UNSET, UNSET, UNSET))
+    self.reset(start, duration, easing, event_id)
+    if rgbw_start is not None:
+      for c in range(4):
+        self.rgbw_start[c] = rgbw_start[c]
+    if rgbw_target is not None:
+      for c in range(4):
+        self.rgbw_target[c] = rgbw_target[c]
 
+  def reset(self, start, duration, easing=DEFAULT, event_id=0):
+    """
+    Reuses the event without allocating. Colors are to be written in rgbw_start and rgbw_target
+    """
+    self.id = event_id
     self.start = start
-    self.duration = duration
+    # A duration of 0 and 1 will still be the next update cycle
+    self.duration = duration if duration > 0 else 1
+    self.easing = easing
     self.active = False
-    self.rgbwt_start = {"r": None, "g": None, "b": None, "w": None}
-    self.rgbwt_target = {"r": None, "g": None, "b": None, "w": None}
-    self.rgbwt_start.update(rgbwt_start)
-    self.rgbwt_target.update(rgbwt_target)
 
-  def initiate(self, pca_values):
-    for key in pca_values:
-      self.rgbwt_start[key] = pca_values[key] if self.rgbwt_start[key] is None else self.rgbwt_start[key]
-      self.rgbwt_target[key] = pca_values[key] if self.rgbwt_target[key] is None else self.rgbwt_target[key]
-    self.active = True
-    print("Target:")
-    print(self.rgbwt_target)
-
-  def get_status(self, t):
+  def initiate(self, values):
     """
-    
+    Replaces UNSET channels by current values
+    :values: array | current RGBW values
     """
-    if t < self.start:
-      return 0
-    elif not self.active:
-      return 1
-    elif self.active and self.start < t < self.start + self.duration:
-      return 2
-    else:
-      return 3
+    for c in range(4):
+      if self.rgbw_start[c] == UNSET:
+        self.rgbw_start[c] = values[c]
+      if self.rgbw_target[c] == UNSET:
+        self.rgbw_target[c] = values[c]
+    self.active = True
+    if log.level <= DEBUG:
+      target = self.rgbw_target
+      log.debug("Event {} target {} {} {} {}", self.id, target[0], target[1], target[2], target[3])
 
-  def apply_ease(self, key, t):
+  def coefficient(self, t):
     """
-    
-    :key: str | start/target key
+    Easing coefficient at a given time, shared by every channel
     :t:   Int | Current time
+    :return: Int | coefficient, easing.SCALE being 1
     """
+    return ease(self.easing, progress(t - self.start, self.duration))
 
-    # avoid zero-division. This can be done without changing the behaviour
-    # as a duration of 0 and 1 will still be the next update cycle
-    if self.duration == 0:
-      self.duration = 1
-
-    # Preparing variables used in computing new value
-    start = self.rgbwt_start[key]
+  def apply_ease(self, values, coef):
+    """
+    Writes the eased color in values, integers only
+    :values: array | RGBW values to update
+    :coef: Int | easing coefficient, see coefficient
+    """
+    for c in range(4):
+      start = self.rgbw_start[c]
+      values[c] = start + (self.rgbw_target[c] - start) * coef // SCALE
 
-    completion_rate = (t - self.start) / self.duration
-    completion_rate = 0 if completion_rate < 0 else 1 if completion_rate > 1 else completion_rate
 
-    coef = self.easing(completion_rate)
-    difference = self.rgbwt_target[key] - self.rgbwt_start[key]
+class EventPool:
+  def __init__(self, size=2):
+    """
+    Preallocated events, recycled once ended so playback doesn't allocate
+    :size: Int | number of events. LightMix only runs one event at a time
+    """
+    self._events = [Event(0) for _ in range(size)]
 
-    new_value = start + difference * coef
-    return new_value
+  def acquire(self):
+    """
+    :return: Event | a free event, a new one if the pool is empty
+    """
+    if self._events:
+      return self._events.pop()
+    return Event(0)
 
-  def easing(self, t):
+  def release(self, event):
     """
-    Quadratic In/out easing method
-    :t: float beetween 0 and 1. Representing completion of the event
-    :return: float beetween 0 and 1. Coefficient of easing
+    Gives an event back to the pool
     """
-    return 2 * t * t if t < 0.5 else -1 + (4 - 2 * t) * t
+    if event not in self._events:
+      self._events.append(event)
@@ -0,0 +1,265 @@
+from array import array
+from event import EventPool, UNSET
+from easing import DEFAULT
+
+try:
+    import _thread as thread
+except ImportError:
+    thread = None
+
+# Flags stored alongside each event record
+FLAG_NOW = 1  # No "t" provided, start is resolved when the event is loaded
+FLAG_KEEP_START = 2  # No starting color, current color is used
+FLAG_KEEP_TARGET = 4  # No targeted color, current color is used
+
+# Packed binary event record, little endian :
+# start (int64, ms) | duration (uint32, ms) | start RGBW (4 x uint8) | target RGBW (4 x uint8)
+# | flags (uint8) | easing curve id (uint8, see easing.CURVES)
+RECORD_FORMAT = "<qL8BBB"
+RECORD_SIZE = 22
+
+# Largest values the record arrays hold : durations are 32 bits signed, starts 64 bits signed
+# (with room left for start + duration and timeline conversions)
+MAX_DURATION = 0x7FFFFFFF
+MAX_START = 1 << 62
+
+
+class _NoLock:
+    """
+    Stand-in lock for ports without _thread
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class EventQueue:
+    def __init__(self, capacity=512):
+        """
+        Fixed-capacity event store, indexed by start time.
+        Records are written by the web server thread and popped by the tick loop,
+        every field lives in a preallocated array so queuing doesn't grow the heap.
+        Records are stored in slots, and `order` keeps slot numbers sorted by descending start time
+        (insertion order for identical starts), so the next due event is always last :
+        popping it doesn't move the others.
+
+        :capacity: Int | Maximum number of buffered events
+        """
+        self.capacity = capacity
+        self.starts = array("q", [0] * capacity)
+        self.durations = array("l", [0] * capacity)
+        self.ids = array("l", [0] * capacity)
+        # 8 channels per record : start RGBW then target RGBW, 10 bits or UNSET
+        self.colors = array("h", [UNSET] * (capacity * 8))
+        self.flags = bytearray(capacity)
+        self.easings = bytearray(capacity)
+
+        # Slots sorted by descending start time, then free slots stack
+        self.order = array("H", range(capacity))
+        self._free = array("H", range(capacity))
+        self._free_count = capacity
+        self._size = 0
+        self._next_id = 1
+        # Cached end of the last ending record, recomputed when that record is removed
+        self._end = None
+        self._end_stale = False
+        self.pool = EventPool()
+        self._lock = thread.allocate_lock() if thread else _NoLock()
+
+    def __len__(self):
+        return self._size
+
+    def _bisect(self, start):
+        """
+        Position of the first record starting at or before start, in order (descending start times)
+        """
+        low = 0
+        high = self._size
+        while low < high:
+            middle = (low + high) // 2
+            if self.starts[self.order[middle]] > start:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def push(self, start, duration, rgbw_start=None, rgbw_target=None, flags=0, easing=DEFAULT):
+        """
+        Inserts an event record according to its start time
+        :start: Int | Starting point (timeline, in milliseconds). Used for ordering only with FLAG_NOW
+        :duration: Int | duration in milliseconds
+        :rgbw_start: Tuple of 4 Int (10 bits) or None | Starting color, None keeps current color
+        :rgbw_target: Tuple of 4 Int (10 bits) or None | Targeted color, None keeps current color
+        :flags: Int | FLAG_* bitfield
+        :easing: Int | easing curve id
+        :return: Int | event id, 0 if the queue is full
+        Raises OverflowError if start or duration doesn't fit the record arrays, see MAX_START and MAX_DURATION
+        """
+        with self._lock:
+            if self._free_count == 0:
+                return 0
+            # The slot is only taken once every field is written, a failed write doesn't leak it
+            i = self._free[self._free_count - 1]
+            self.starts[i] = start
+            self.durations[i] = duration
+            self.flags[i] = flags
+            self.easings[i] = easing
+            offset = i * 8
+            for c in range(4):
+                self.colors[offset + c] = UNSET if rgbw_start is None else rgbw_start[c]
+                self.colors[offset + 4 + c] = UNSET if rgbw_target is None else rgbw_target[c]
+            event_id = self._next_id
+            self.ids[i] = event_id
+            self._next_id += 1
+            self._free_count -= 1
+
+            # Inserting in order, popped after events starting at the same time
+            position = self._bisect(start)
+            if position < self._size:
+                self.order[position + 1:self._size + 1] = self.order[position:self._size]
+            self.order[position] = i
+            self._size += 1
+            # Untimed records only get their start when loaded, they don't count in last_end
+            end = start + duration
+            if not flags & FLAG_NOW and not self._end_stale and (self._end is None or end > self._end):
+                self._end = end
+            return event_id
+
+    def last_end(self):
+        """
+        End time of the last ending timed event : FLAG_NOW records start when loaded, after earlier events,
+        so their end isn't known. Cached : only scans the queue when that event was removed
+        :return: Int or None if no timed event is queued
+        """
+        with self._lock:
+            if self._end_stale:
+                end = None
+                for p in range(self._size):
+                    i = self.order[p]
+                    if self.flags[i] & FLAG_NOW:
+                        continue
+                    if end is None or self.starts[i] + self.durations[i] > end:
+                        end = self.starts[i] + self.durations[i]
+                self._end = end
+                self._end_stale = False
+            return self._end
+
+    def next_start(self):
+        """
+        Start time of the next event
+        :return: Int or None if the queue is empty
+        """
+        size = self._size
+        if size == 0:
+            return None
+        return self.starts[self.order[size - 1]]
+
+    def start_at(self, position):
+        """
+        Start time of an event, by position in start order
+        :position: Int | 0 for the next event
+        :return: Int or None if there is no such event
+        """
+        with self._lock:
+            if position >= self._size:
+                return None
+            return self.starts[self.order[self._size - 1 - position]]
+
+    def pop(self, now):
+        """
+        Removes the next due record of the queue and returns it as an Event from the pool.
+        The event is to be given back with release once ended.
+        :now: Int | Current timeline time
+        :return: Event or None if no event is due
+        """
+        with self._lock:
+            if self._size == 0:
+                return None
+            i = self.order[self._size - 1]
+            if self.starts[i] > now:
+                return None
+            start = now if self.flags[i] & FLAG_NOW else self.starts[i]
+            event = self.pool.acquire()
+            event.reset(start, self.durations[i], self.easings[i], self.ids[i])
+            offset = i * 8
+            for c in range(4):
+                event.rgbw_start[c] = self.colors[offset + c]
+                event.rgbw_target[c] = self.colors[offset + 4 + c]
+            # Last in order : nothing to move
+            self._remove(self._size - 1, 1)
+            return event
+
+    def release(self, event):
+        """
+        Gives a popped event back to the pool
+        """
+        self.pool.release(event)
+
+    def _remove(self, position, count):
+        """
+        Frees count records from position in order. Lock must be held.
+        """
+        for p in range(position, position + count):
+            i = self.order[p]
+            self._free[self._free_count] = i
+            self._free_count += 1
+            if self._end is not None and not self.flags[i] & FLAG_NOW and \
+                    self.starts[i] + self.durations[i] >= self._end:
+                self._end_stale = True
+        # Copied in place, slices would allocate
+        for p in range(position + count, self._size):
+            self.order[p - count] = self.order[p]
+        self._size -= count
+
+    def shift(self, delta):
+        """
+        Moves every queued start time back, when the timeline epoch changes
+        :delta: Int | milliseconds substracted from start times
+        """
+        with self._lock:
+            for p in range(self._size):
+                self.starts[self.order[p]] -= delta
+            if self._end is not None:
+                self._end -= delta
+
+    def cancel(self, event_id):
+        """
+        Removes a single event
+        :event_id: Int | id returned by push
+        :return: Boolean | False if the event isn't queued
+        """
+        with self._lock:
+            for p in range(self._size):
+                if self.ids[self.order[p]] == event_id:
+                    self._remove(p, 1)
+                    return True
+            return False
+
+    def cancel_range(self, start, end):
+        """
+        Removes every event starting in [start, end[
+        :start: Int | timeline time, in milliseconds
+        :end: Int | timeline time, in milliseconds
+        :return: Int | number of removed events
+        """
+        with self._lock:
+            # Descending order : records starting before end, up to records starting before start
+            first = self._bisect(end - 1)
+            last = self._bisect(start - 1)
+            if last > first:
+                self._remove(first, last - first)
+            return max(0, last - first)
+
+    def clear(self):
+        """
+        Drops every queued record
+        """
+        with self._lock:
+            self._size = 0
+            self._end = None
+            self._end_stale = False
+            self._free_count = self.capacity
+            for i in range(self.capacity):
+                self._free[i] = i
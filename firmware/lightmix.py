@@ -1,8 +1,18 @@
 from machine import Pin, PWM
-from math import floor
-import time
-from event import Event
+from array import array
+from struct import unpack_from
+from event_queue import EventQueue, FLAG_NOW, FLAG_KEEP_START, FLAG_KEEP_TARGET, RECORD_FORMAT, RECORD_SIZE, \
+    MAX_DURATION, MAX_START
 from wandering import WanderingCoefficient
+from clock import ClockSync
+from easing import CURVES, DEFAULT, SCALE, curve_id
+from tracing import tracer, HTTP
+from log import log, DEBUG
+
+LOAD_SPAN = tracer.span("load_new_event")
+COMPUTE_SPAN = tracer.span("compute_event")
+PWM_SPAN = tracer.span("update_pwm")
+PARSE_SPAN = tracer.span("event_from_string", HTTP)
 
 class LightMix:
     def __init__(self):
@@ -11,91 +21,275 @@ class LightMix:
         Programmed throught events
         Manage timed color-change event queue and push them throught the PCA9685.
         """
-        self.time_offset = 0
-        self.pin_indexes = {
-            "r": PWM(Pin(17), freq=78125, duty=0),  # 17
-            "g": PWM(Pin(16), freq=78125, duty=0),  # 16
-            "b": PWM(Pin(22), freq=78125, duty=0),  # 22
-            "w": PWM(Pin(21), freq=78125, duty=0)  # 21
-        }
+        self.clock = ClockSync()
+        # Channels are always ordered as R, G, B, W
+        self.pins = (
+            PWM(Pin(17), freq=78125, duty=0),  # 17
+            PWM(Pin(16), freq=78125, duty=0),  # 16
+            PWM(Pin(22), freq=78125, duty=0),  # 22
+            PWM(Pin(21), freq=78125, duty=0)  # 21
+        )
 
-        self.values = {"r": 0, "g": 0, "b": 0, "w": 0}
-        self.masters = {"r": 100, "g": 100, "b": 100, "w": 60}
+        # 10 bits RGBW values
+        self.values = array("h", [0, 0, 0, 0])
+        # Last duty written on each channel, PWM are only written on change
+        self.duties = array("h", [0, 0, 0, 0])
+        # Channels maximum power, in %
+        self.masters = array("h", [100, 100, 100, 60])
         self.event = None
-        self.queue = ""
+        self.queue = EventQueue()
         self.wanderer = WanderingCoefficient(1000, 1000, 100, 100, 100, 100)
 
+    @property
+    def time_offset(self):
+        """
+        Current offset beetween client time and local time, in milliseconds
+        """
+        return self.clock.offset
+
     def set_time_offset(self, client_time):
         """
         Saves client time to handle timed events in sync with client
         :client_time: int
         """
-        self.time_offset = client_time - time.ticks_ms()
+        self.rebase(self.clock.calibrate(client_time))
 
-    def update(self, *args):
+    def add_sync_sample(self, local, offset, delay):
         """
-        Manages the event queue and wanderer coefficient
+        Adds a clock sync sample, see ClockSync.add_sample
         """
-        t = time.ticks_ms() + self.time_offset
+        self.rebase(self.clock.add_sample(local, offset, delay))
 
-        if not self.event:
-            self.load_new_event()
+    def rebase(self, change):
+        """
+        Moves stored times when the timeline epoch changed
+        :change: Int | epoch change, in milliseconds
+        """
+        if change:
+            self.queue.shift(change)
+            if self.event:
+                self.event.start -= change
 
+    def release_event(self):
+        """
+        Gives the current event back to the queue pool
+        """
         if self.event:
-            status = self.event.get_status(t)
-            # Status 0, Scheduled but not started. Do nothing
-            # Status 1, initiating event
-            if status == 1:
-                # Init event (taking previous colors, current time etc)
-                print("Init event {}".format(self.event))
-                self.event.initiate(self.values)
-            elif status == 2:
+            self.queue.release(self.event)
+            self.event = None
+
+    def clear(self):
+        """
+        Removes the current event and every queued event
+        """
+        self.release_event()
+        self.queue.clear()
+
+    def update(self, *args):
+        """
+        Manages the event queue and wanderer coefficient
+        :return: Int | milliseconds before the next change, None if nothing is scheduled
+        """
+        # Timeline time, small integers only
+        t = self.clock.advance()
+
+        # Catching up : every event whose window has fully passed is applied at once,
+        # carrying its target color forward, until reaching the event active at t
+        while True:
+            if not self.event:
+                self.load_new_event(t)
+                if not self.event:
+                    break
+            event = self.event
+            # Scheduled but not started. Do nothing
+            if t < event.start:
+                break
+            # Init event (taking previous colors)
+            if not event.active:
+                if log.level <= DEBUG:
+                    log.debug("[LightMix] Init event {} at {}", event.id, event.start)
+                event.initiate(self.values)
+            # Running event
+            if t < event.start + event.duration:
                 self.compute_event(t)
-            # Status 3, ending event
-            elif status == 3:
-                self.end_event()
+                break
+            # Ending event
+            self.end_event()
 
         self.update_pwm()
+        return self.next_change(t)
+
+    def next_change(self, t):
+        """
+        Computes when the output will change next : current event, next queued event or wanderer target
+        :t: Int, Current time
+        :return: Int | milliseconds before the next change, 0 if changing, None if nothing is scheduled
+        """
+        if self.event:
+            # Running event, or status change pending
+            if t >= self.event.start:
+                return 0
+            delay = self.event.start - t
+        else:
+            # Next event is loaded once due
+            delay = self.queue.next_start()
+            if delay is not None:
+                delay = max(0, delay - t)
+
+        wanderer_delay = self.wanderer.next_change()
+        if delay is None or (wanderer_delay is not None and wanderer_delay < delay):
+            return wanderer_delay
+        return delay
+
+    def buffered_until(self):
+        """
+        End of the queued and running events, in client (calibrated) time.
+        Only timed events count : queued events without "t" start when loaded, see EventQueue.last_end
+        :return: Int or None if nothing is scheduled
+        """
+        end = self.queue.last_end()
+        event = self.event
+        if event and (end is None or event.start + event.duration > end):
+            end = event.start + event.duration
+        return None if end is None else end + self.clock.epoch
+
+    def horizon(self):
+        """
+        Buffered time : how long the queued and running events keep the output busy
+        :return: Int | milliseconds from now, 0 if nothing is scheduled
+        """
+        end = self.buffered_until()
+        return max(0, end - self.clock.now()) if end is not None else 0
+
+    def load_new_event(self, t):
+        """
+        Charge a new event if an event of the queue is due
+        :t: Int, Current time
+        """
+        tracer.begin(LOAD_SPAN)
+        self.event = self.queue.pop(t)
+        tracer.end(LOAD_SPAN)
 
-    def load_new_event(self):
+    def cancel(self, event_id):
+        """
+        Cancels a single event, queued or running
+        :event_id: Int
+        :return: Boolean | False if the event doesn't exist (anymore)
+        """
+        if self.event and self.event.id == event_id:
+            self.release_event()
+            return True
+        return self.queue.cancel(event_id)
+
+    def cancel_range(self, start, end):
+        """
+        Cancels every event starting in [start, end[, queued or running
+        :start: Int | client time, in milliseconds
+        :end: Int | client time, in milliseconds
+        :return: Int | number of cancelled events
         """
-        Charge a new event if there is an event in the queue
+        start = self.clock.timeline(start)
+        end = self.clock.timeline(end)
+        cancelled = self.queue.cancel_range(start, end)
+        event = self.event
+        if event and start <= event.start < end:
+            self.release_event()
+            cancelled += 1
+        return cancelled
+
+    def add_event(self, parameters):
         """
-        if len(self.queue) > 0:
-            # Getting new event
-            new_event = self.queue.split("#", 1)[0]
-            self.queue = self.queue.split("#", 1)[1]
-            # Parsing new event from the new_event string
-            self.event = self.event_from_string(new_event)
+        Parses an event string and stores it in the queue
+        :parameters: Str | Event string, see event_from_string
+        :return: Int | event id, 0 if the queue is full
+        Raises ValueError if the event is improperly formatted or out of range
+        """
+        tracer.begin(PARSE_SPAN)
+        start, duration, rgbw_start, rgbw_target, flags, easing = self.event_from_string(parameters)
+        tracer.end(PARSE_SPAN)
+        # Events without starting point are ordered as starting now
+        if flags & FLAG_NOW:
+            start = self.clock.now()
+        start = self.clock.timeline(start)
+        if not -MAX_START < start < MAX_START:
+            raise ValueError("Start out of range")
+        return self.queue.push(start, duration, rgbw_start, rgbw_target, flags, easing)
+
+    def add_packed_events(self, buffer):
+        """
+        Decodes packed binary event records (see event_queue.RECORD_FORMAT) into the queue
+        :buffer: bytes, bytearray or memoryview | concatenated records
+        :return: Tuple (queued, rejected, first_id, last_id)
+        """
+        queued = 0
+        rejected = 0
+        first_id = 0
+        last_id = 0
+        now = self.clock.timeline(self.clock.now())
+        timeline = self.clock.timeline
+        convert = self.convert_to_10_bit
+        for offset in range(0, len(buffer) - RECORD_SIZE + 1, RECORD_SIZE):
+            record = unpack_from(RECORD_FORMAT, buffer, offset)
+            flags = record[10]
+            rgbw_start = None if flags & FLAG_KEEP_START else (
+                convert(record[2]), convert(record[3]), convert(record[4]), convert(record[5]))
+            rgbw_target = None if flags & FLAG_KEEP_TARGET else (
+                convert(record[6]), convert(record[7]), convert(record[8]), convert(record[9]))
+            start = now if flags & FLAG_NOW else timeline(record[0])
+            # Out of range records would overflow the queue arrays
+            if record[11] >= len(CURVES) or record[1] > MAX_DURATION or not -MAX_START < start < MAX_START:
+                rejected += 1
+                continue
+            event_id = self.queue.push(start, record[1], rgbw_start, rgbw_target, flags & FLAG_NOW, record[11])
+            if event_id:
+                queued += 1
+                first_id = first_id or event_id
+                last_id = event_id
+            else:
+                rejected += 1
+        # Trailing bytes that doesn't make a full record
+        if len(buffer) % RECORD_SIZE:
+            rejected += 1
+        return queued, rejected, first_id, last_id
 
     def end_event(self):
         """
         Set all values to current event target RGBW
         """
-        for k in self.values:
-            if self.event.rgbwt_target:
-                self.values[k] = self.event.rgbwt_target[k]
-        print("[LightMix] End event.")
-        self.event = None
+        for c in range(4):
+            self.values[c] = self.event.rgbw_target[c]
+        if log.level <= DEBUG:
+            log.debug("[LightMix] End event {}", self.event.id)
+        self.release_event()
 
     def compute_event(self, t):
         """
         Set all values according to the completion rate of the current event
         :t: Int, Current time
         """
-        for k in self.values:
-            self.values[k] = self.event.apply_ease(k, t)
+        tracer.begin(COMPUTE_SPAN)
+        self.event.apply_ease(self.values, self.event.coefficient(t))
+        tracer.end(COMPUTE_SPAN)
 
     def update_pwm(self):
         """
         Update PCA9685 channels, taking wanderer into account
+        Integer only : the wanderer coefficient is a fixed point number, easing.SCALE being 100%
         """
+        tracer.begin(PWM_SPAN)
         c = self.wanderer.coefficient
-
-        for k, v in self.values.items():
-            self.values[k] = min(max(0, v), 1023)
-            duty = int(self.values[k] * (c / 100) * self.masters[k] / 100)
-            self.pin_indexes[k].duty(max(5, duty) if duty > 1 else 0)
+        values = self.values
+
+        for i in range(4):
+            v = values[i]
+            v = 0 if v < 0 else 1023 if v > 1023 else v
+            values[i] = v
+            duty = v * c // SCALE * self.masters[i] // 100
+            duty = max(5, duty) if duty > 1 else 0
+            if duty != self.duties[i]:
+                self.pins[i].duty(duty)
+                self.duties[i] = duty
+        tracer.end(PWM_SPAN)
 
         # print(self.values)
 
@@ -113,44 +307,46 @@ class LightMix:
         ce (colors at end)
         d (duration)
         k (keylight)
-        Returns: List of tuples. Key of value may be empty
+        e (easing curve name or id)
+        Returns: Tuple of EventQueue.push arguments (start, duration, rgbw_start, rgbw_target, flags, easing)
+        Raises ValueError if a parameter can't be parsed or is out of range (see event_queue.MAX_DURATION, MAX_START)
         """
 
-        formatted_parameters = []
+        params = {}
         # Splitting parameters into fragments
-        fragments = parameters.split("&")
-        # Adding fragments to the returned list
-        for frag in fragments:
+        for frag in parameters.split("&"):
             key_value = frag.split("=", 1)
-            # Parameters doesn't have value
-            if len(key_value) == 1:
-                formatted_parameters.append((key_value[0], ''))
-            # Parameters has value
-            else:
-                formatted_parameters.append((key_value[0], key_value[1]))
+            params[key_value[0]] = key_value[1] if len(key_value) > 1 else ''
 
-        params = {k: v for k, v in formatted_parameters}
+        # Keylight as a fixed point number, 256 being 1
+        keylight = int(float(params["k"]) * 256) if "k" in params else 0
 
         # Appling all modifiers
+        colors = []
         for color in ['cs', 'ce']:
-            if color in params:
-                # Sanityzing input
-                params[color] = self.sanitize_rgbw(params[color])
-
-                # Applying keylight
-                if "k" in params:
-                    params[color] = self.apply_keylight(params[color], float(params["k"]))
-
-            # Building event dict
-            params[color] = {
-                "r": self.convert_to_10_bit(int("0x" + params[color][0:2])) if color in params else None,
-                "g": self.convert_to_10_bit(int("0x" + params[color][2:4])) if color in params else None,
-                "b": self.convert_to_10_bit(int("0x" + params[color][4:6])) if color in params else None,
-                "w": self.convert_to_10_bit(int("0x" + params[color][6:8])) if color in params else None,
-            }
-
-        # Computing starting time
-        start_time = int(params["t"]) if 't' in params else self.time_offset + time.ticks_ms()
+            if color not in params:
+                colors.append(None)
+                continue
+            # Sanityzing input
+            value = self.sanitize_rgbw(params[color])
+            if len(value) != 8:
+                raise ValueError("Unsupported color {}".format(params[color]))
+
+            rgbw = [int(value[i:i + 2], 16) for i in range(0, 8, 2)]
+
+            # Applying keylight
+            if keylight:
+                rgbw = self.apply_keylight(rgbw, keylight)
+
+            colors.append(tuple(self.convert_to_10_bit(v) for v in rgbw))
+
+        # Computing starting time, resolved at execution time if not provided
+        if 't' in params:
+            start_time = int(params["t"])
+            flags = 0
+        else:
+            start_time = 0
+            flags = FLAG_NOW
 
         # Defining duration
         if "d" in params:
@@ -158,33 +354,20 @@ class LightMix:
         else:
             duration = 1
 
-        return Event(start_time, duration, params["cs"], params["ce"])
-
-    def convert_to_10_bit(self, value):
-        return value * 4 + floor(value / 4)
-
-    def sanitize_rgbw(self, value):
-        # Truncating
-        while len(value) > 8:
-            value = value[:-1]
-
-        # Case 1x 8bit (white)
-        if len(value) == 2:
-            value = "000000" + value
+        if not 0 <= duration <= MAX_DURATION:
+            raise ValueError("Duration out of range")
+        if not -MAX_START < start_time < MAX_START:
+            raise ValueError("Start out of range")
 
-        # Case 2x 8bit (Hue/Saturation)
-        elif len(value) == 4:
-            pass  # TODO Implement Hue Saturation support
+        easing = curve_id(params["e"]) if "e" in params else DEFAULT
 
-        if len(value) == 6:
-            # Auto White
-            w = "00"
-            if value[0:2] == value[2:4] and value[2:4] == value[4:6]:
-                w = value[0:2]
-                value = "000000"
-            value = value + w
+        return start_time, duration, colors[0], colors[1], flags, easing
 
-        return value
+    def convert_to_10_bit(self, value):
+        """
+        Spreads a 8 bits value over 10 bits, 255 giving 1023
+        """
+        return (value << 2) | (value >> 6)
 
     def sanitize_rgbw(self, value):
         # Truncating
@@ -210,28 +393,12 @@ class LightMix:
         return value
 
     def apply_keylight(self, value, keylight):
-        value = {
-            "r": int("0x{}".format(value[0:2]), 16),
-            "g": int("0x{}".format(value[2:4]), 16),
-            "b": int("0x{}".format(value[4:6]), 16),
-            "w": int("0x{}".format(value[6:8]), 16)
-        }
-
-        keylight_amount = int((value["r"] + value["g"] + value["b"]) / 3 * keylight)
-        value["w"] = min(255, value["w"] + keylight_amount)
-
-        value = {
-            "r": hex(value["r"])[2:],
-            "g": hex(value["g"])[2:],
-            "b": hex(value["b"])[2:],
-            "w": hex(value["w"])[2:]
-        }
-
-        value = "{}{}{}{}".format(
-            value["r"] if len(value["r"]) == 2 else "0" + value["r"],
-            value["g"] if len(value["g"]) == 2 else "0" + value["g"],
-            value["b"] if len(value["b"]) == 2 else "0" + value["b"],
-            value["w"] if len(value["w"]) == 2 else "0" + value["w"]
-        )
-
+        """
+        Adds white to the mix according to the other channels
+        :value: List of 4 Int | 8 bits RGBW
+        :keylight: Int | keylight coefficient, 256 being 1
+        :return: List of 4 Int | 8 bits RGBW
+        """
+        keylight_amount = (value[0] + value[1] + value[2]) * keylight // 768
+        value[3] = min(255, value[3] + keylight_amount)
         return value
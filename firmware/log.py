@@ -0,0 +1,112 @@
+import time
+from array import array
+
+# Levels
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+
+class Logger:
+    def __init__(self, capacity=64, level=INFO):
+        """
+        Leveled, buffered logger.
+        Messages are stored unformatted (format string and arguments) into a RAM ring,
+        the oldest ones being overwritten. They are only formatted when drained to serial,
+        between ticks, or fetched over HTTP. Calls below the level return right away ;
+        hot paths can test `level` first to skip the call entirely.
+
+        Arguments are kept until formatting : pass values, not objects that change later.
+
+        :capacity: Int | number of messages kept
+        :level: Int | minimum level recorded
+        """
+        self.capacity = capacity
+        self.level = level
+        self.times = array("l", [0] * capacity)
+        self.levels = bytearray(capacity)
+        self.formats = [None] * capacity
+        self.arguments = [None] * capacity
+        self._next = 0  # next message slot
+        self._count = 0
+        self._written = 0  # messages not yet written to serial
+        self.dropped = 0  # messages overwritten before being written
+
+    def debug(self, message, *args):
+        if self.level <= DEBUG:
+            self._record(DEBUG, message, args)
+
+    def info(self, message, *args):
+        if self.level <= INFO:
+            self._record(INFO, message, args)
+
+    def warning(self, message, *args):
+        if self.level <= WARNING:
+            self._record(WARNING, message, args)
+
+    def error(self, message, *args):
+        if self.level <= ERROR:
+            self._record(ERROR, message, args)
+
+    def _record(self, level, message, args):
+        i = self._next
+        self.times[i] = time.ticks_ms()
+        self.levels[i] = level
+        self.formats[i] = message
+        self.arguments[i] = args
+        self._next = (i + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+        if self._written < self.capacity:
+            self._written += 1
+        else:
+            self.dropped += 1
+
+    def format(self, i):
+        """
+        Formats a stored message
+        :i: Int | ring slot
+        :return: Str
+        """
+        message = self.formats[i]
+        if self.arguments[i]:
+            try:
+                message = message.format(*self.arguments[i])
+            except Exception:
+                message = "{} {}".format(message, self.arguments[i])
+        return "[{}] {} {}".format(self.times[i], LEVEL_NAMES.get(self.levels[i], self.levels[i]), message)
+
+    def drain(self, budget):
+        """
+        Writes pending messages to serial, oldest first, within a time budget.
+        Called by the tick loop between ticks.
+        :budget: Int | time available, in microseconds
+        :return: Int | number of messages written
+        """
+        start = time.ticks_us()
+        written = 0
+        while self._written and time.ticks_diff(time.ticks_us(), start) < budget:
+            print(self.format((self._next - self._written) % self.capacity))
+            self._written -= 1
+            written += 1
+        return written
+
+    def records(self, level=DEBUG):
+        """
+        Formatted messages kept in the ring, oldest first
+        :level: Int | minimum level
+        :return: List of Str
+        """
+        records = []
+        for n in range(self._count):
+            i = (self._next - self._count + n) % self.capacity
+            if self.levels[i] >= level:
+                records.append(self.format(i))
+        return records
+
+
+# Shared by every module
+log = Logger()
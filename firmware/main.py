@@ -1,17 +1,35 @@
 from lightmix import LightMix
 from event import Event
+from event_queue import RECORD_SIZE
 from machine import Timer
+from scheduler import TickScheduler
+from collector import SlackCollector
+from admission import Admission, QUEUE_FULL, LOW_MEMORY
 import time
+import gc
 import requests
+from requests import asyncio
+import udp
+from tracing import tracer
+import log
+from log import log as logger
+from struct import unpack_from
 import sys
+import network
+import credentials
 from credentials import PASS, SSID
 
 # Declaring important objects
 lightmix = LightMix()
 lightmix_clock = Timer(0)
+# Requests adding events are refused as a whole when the queue or the heap can't take them
+admission = Admission(lightmix)
 
 # Network items
 server = requests.WebServer()
+# Panel array control channel. Panel id and groups bitmask can be set in credentials.py
+udp_server = udp.UDPServer(panel=getattr(credentials, "PANEL_ID", None),
+                           groups=getattr(credentials, "PANEL_GROUPS", 0))
 station = network.WLAN(network.STA_IF)
 access_point = network.WLAN(network.AP_IF)
 
@@ -24,6 +42,32 @@ ap_pass = "admin"
 
 # access_point.config(essid=name, password=ap_pass, authmode=network.AUTH_WPA_WPA2_PSK)
 
+def refusal(result, retry_after, count):
+    """
+    Response to a request refused by admission control, see Admission.check.
+    Refusals that may succeed later come with a Retry-After header, in seconds
+
+    :result: Int | Admission.check result, used as status code
+    :retry_after: Int | milliseconds
+    :count: Int | number of refused events
+    :return: Http Response
+    """
+    if result == QUEUE_FULL:
+        message = "Queue full"
+    elif result == LOW_MEMORY:
+        message = "Memory low"
+    else:
+        message = "Larger than the queue"
+    content = {
+        "success": False,
+        "message": "{}, {} event(s) refused".format(message, count),
+        "retry_after": retry_after
+    }
+    content.update(admission.status())
+    headers = {"Retry-After": max(1, (retry_after + 999) // 1000)} if retry_after else None
+    return requests.Response(code=result, content=content, headers=headers)
+
+
 @server.route("/calibrate")
 def calibrate(request):
     """
@@ -37,9 +81,10 @@ def calibrate(request):
     :return: HTTP Response
     """
 
-    print("Calibration request...")
+    logger.info("Calibration request...")
     # Setting new time offset
     lightmix.set_time_offset(int(request.params_dict()["current_time"]))
+    scheduler.wake()
     # Composing HTTP Response
     content = {
         "success": True,
@@ -49,6 +94,89 @@ def calibrate(request):
     return requests.Response(code=200, content=content)
 
 
+@server.route("/sync")
+def sync(request):
+    """
+    NTP-style synchronisation. The client timestamps the request sending (t0)
+    and the response receipt (t3), the LightMix timestamps the request receipt (t1)
+    and the response sending (t2), in local time. The client then computes :
+      offset = ((t0 - t1) + (t3 - t2)) / 2
+      delay = (t3 - t0) - (t2 - t1)
+    and sends them with the next sync request. The LightMix filters samples and
+    corrects its clock rate, so calibration is rarely needed.
+
+    http params:
+      t0 (optionnal)     - client time when sending the request ; integer, echoed
+      offset (optionnal) - offset computed from the previous exchange ; integer
+      delay (optionnal)  - round trip delay of the previous exchange ; positive integer
+      at (optionnal)     - t1 of the previous exchange ; integer
+
+    :request: Http Request Object
+    :return: Http Response
+    """
+    t1 = lightmix.clock.local()
+    parameters = request.params_dict()
+    try:
+        t0 = int(parameters["t0"]) if "t0" in parameters else None
+        if "offset" in parameters:
+            lightmix.add_sync_sample(int(parameters["at"]), int(parameters["offset"]), int(parameters["delay"]))
+            scheduler.wake()
+    except (KeyError, ValueError):
+        return requests.Response(code=400, content={"success": False, "message": "Invalid sync sample"})
+
+    return requests.Response(code=200, content={
+        "success": True,
+        "t0": t0,
+        "t1": t1,
+        "offset": lightmix.clock.offset,
+        "skew": lightmix.clock.skew,
+        "delay": lightmix.clock.delay,
+        "t2": lightmix.clock.local()
+    })
+
+
+def queue_events(ids, events):
+    """
+    Queues /addevent events once admitted, see addevent.
+    Events are parsed here, so the tick loop only pops ready-made records
+
+    :ids: List | ids of the events already queued by the request, None if there is none yet
+    :events: List of Str | event strings
+    :return: List of ids (0 for rejected events), or the refusal Response if nothing is queued
+    """
+    result, retry_after = admission.check(len(events))
+    if result:
+        if ids is None:
+            return refusal(result, retry_after, len(events))
+        # Beginning of a streamed query already queued : rejecting the rest
+        ids.extend([0] * len(events))
+        return ids
+    if ids is None:
+        ids = []
+    for element in events:
+        try:
+            ids.append(lightmix.add_event(element))
+        except (ValueError, IndexError, OverflowError):
+            ids.append(0)
+    scheduler.wake()
+    return ids
+
+
+@server.stream_query("/addevent")
+def add_chained_events(state, chunk):
+    """
+    Queues the events of chained queries longer than the head buffer, as they are received.
+    Each chunk goes through admission control. Kept in request.state : ids, or the refusal response
+
+    :state: see queue_events
+    :chunk: memoryview | whole events, separated by "&&"
+    :return: new state
+    """
+    if isinstance(state, requests.Response):
+        return state
+    return queue_events(state, bytes(chunk).decode().split("&&"))
+
+
 @server.route("/addevent")
 def addevent(request):
     """
@@ -60,22 +188,123 @@ def addevent(request):
       t (optionnal)  - timestamp to schedule event execution ; positive int
       d (optionnal)  - duration in millisecond of the event ; positive int
       k (optionnal)  - keylight coefficient ; add a white tint to global color
+      e (optionnal)  - easing curve ; name or id, see easing.CURVES
 
       Multiple collections of parameters can be added, with "&&" separator. They will
-      be considered as seperate event, and will be added to the queue in order
+      be considered as seperate event, and will be added to the queue according to their start time.
+      The response holds the id of each event (0 if rejected), to cancel them, and the remaining capacity.
+      When the queue or the heap can't take every event, none is queued, see refusal.
+      Queries longer than the head buffer are queued while received (see add_chained_events) :
+      events the queue can't take anymore are then rejected.
 
     :request: Http Request Object
     :return: Http Response
     """
-    print("Adding event")
-    events = request.raw_params.split("&&")
-    for element in events:
-        try:
-            lightmix.queue += element + '#'
-        except MemoryError:
-            pass
+    logger.debug("Adding event")
+    # Beginning of the query already queued when streamed, see add_chained_events
+    ids = request.state
+    if not isinstance(ids, requests.Response):
+        ids = queue_events(ids, request.raw_params.split("&&") if request.raw_params else [""])
+    if isinstance(ids, requests.Response):
+        return ids
+
+    rejected = ids.count(0)
+    content = {
+        "success": rejected == 0,
+        "message": "{} event(s) queued, {} rejected".format(len(ids) - rejected, rejected),
+        "ids": ids
+    }
+    content.update(admission.status())
+    return requests.Response(code=202, content=content)
 
-    return requests.Response(code=202, content={"success": True, "message": None})
+
+@server.stream("/addevents", RECORD_SIZE)
+def add_records(request, records):
+    """
+    Queues /addevents records as they are received, the body is never stored whole.
+    The whole body goes through admission control on the first chunk.
+    Totals are kept in request.state, or the refusal response
+
+    :request: Http Request Object
+    :records: memoryview | whole records, but the last chunk
+    """
+    if request.state is None:
+        count = (int(request.header("Content-Length", len(records))) + RECORD_SIZE - 1) // RECORD_SIZE
+        result, retry_after = admission.check(count)
+        if result:
+            request.state = refusal(result, retry_after, count)
+    if isinstance(request.state, requests.Response):
+        return
+    queued, rejected, first_id, last_id = lightmix.add_packed_events(records)
+    if request.state:
+        total = request.state
+        request.state = (total[0] + queued, total[1] + rejected, total[2] or first_id, last_id or total[3])
+    else:
+        request.state = (queued, rejected, first_id, last_id)
+    scheduler.wake()
+
+
+@server.route("/addevents", methods=("POST",))
+def addevents(request):
+    """
+    Binary batch event adding HTTP endpoint (POST)
+
+    body:
+      Concatenated packed event records, see event_queue.RECORD_FORMAT.
+      Each record holds start, duration, start/end RGBW, flags and easing.
+      Queued events get consecutive ids, from first_id to last_id,
+      unless events are added concurrently.
+      The body is streamed into the queue (see add_records), so its size isn't limited.
+      When the queue or the heap can't take every record, none is queued, see refusal.
+
+    :request: Http Request Object
+    :return: Http Response
+    """
+    # Body not streamed, when dispatched directly
+    if request.body:
+        add_records(request, request.body)
+    if isinstance(request.state, requests.Response):
+        return request.state
+    queued, rejected, first_id, last_id = request.state or (0, 0, 0, 0)
+
+    content = {
+        "success": rejected == 0,
+        "message": "{} event(s) queued, {} rejected".format(queued, rejected),
+        "first_id": first_id,
+        "last_id": last_id
+    }
+    content.update(admission.status())
+    return requests.Response(code=202, content=content)
+
+
+@server.route("/cancel")
+def cancel(request):
+    """
+    Cancels a single event, or every event starting in a time range.
+    Cancelling a running event stops it at its current color.
+
+    http params:
+      id (optionnal)   - event id, as returned by /addevent
+      from (optionnal) - start of the time range, included ; integer
+      to (optionnal)   - end of the time range, excluded ; integer
+
+    :request: Http Request Object
+    :return: Http Response
+    """
+    parameters = request.params_dict()
+    try:
+        if "id" in parameters:
+            cancelled = 1 if lightmix.cancel(int(parameters["id"])) else 0
+        else:
+            cancelled = lightmix.cancel_range(int(parameters["from"]), int(parameters["to"]))
+    except (KeyError, ValueError):
+        return requests.Response(code=400, content={"success": False, "message": "Provide id, or from and to"})
+    scheduler.wake()
+
+    return requests.Response(code=200, content={
+        "success": cancelled > 0,
+        "message": "{} event(s) cancelled".format(cancelled)
+    })
 
 
 @server.route("/wandering")
@@ -101,39 +330,146 @@ def wandering(request):
         # BUG : max/min time identical ? 
         parameters = request.params_dict()
 
-        # Validating parameters 
-        min_ms = int(parameters["min_ms"])
-        max_ms = int(parameters["max_ms"])
+        # Validating parameters and setting values to the lightmix Wanderer object
+        lightmix.wanderer.configure(
+            int(parameters["min_ms"]), int(parameters["max_ms"]),
+            int(parameters["idle_min_ms"]), int(parameters["idle_max_ms"]),
+            int(parameters["min_c"]), int(parameters["max_c"])
+        )
+        scheduler.wake()
+
+        # Returning Response
+        return requests.Response(code=200, content={"success": True, "message": "Wanderer updated"})
+    # Failure
+    except:
+        return requests.Response(code=200, content={"success": False, "message": "Wanderer not updated"})
+
 
-        idle_min_ms = int(parameters["idle_min_ms"])
-        idle_max_ms = int(parameters["idle_max_ms"])
+@server.route("/stats")
+def stats(request):
+    """
+    Runtime statistics : ticks, queue, memory, routes and clock.
+    Durations are in microseconds, histograms count values below each bound.
+
+    :request: Http Request
+    :return: Http Response
+    """
+    return requests.Response(code=200, content={
+        "success": True,
+        "ticks": {
+            "rate": tick_rate,
+            "count": scheduler.ticks,
+            "missed": scheduler.missed,
+            "skipped": scheduler.skipped,
+            "idle": scheduler.idle,
+            "max_late": scheduler.max_late,
+            "duration": scheduler.durations.as_dict(),
+            "jitter": scheduler.jitter.as_dict()
+        },
+        "queue": {
+            "depth": len(lightmix.queue),
+            "capacity": lightmix.queue.capacity,
+            "horizon": lightmix.horizon(),
+            "max_events": admission.max_events,
+            "refused": admission.refused,
+            "refused_events": admission.refused_events
+        },
+        "memory": {
+            "free": gc.mem_free(),
+            "allocated": gc.mem_alloc(),
+            "collections": collector.collections,
+            "automatic": collector.automatic,
+            "deferred": collector.deferred,
+            "pause": collector.pause,
+            "max_pause": collector.max_pause,
+            "total_pause": collector.total_pause
+        },
+        "routes": {route: histogram.as_dict() for route, histogram in server.routes_stats.items()},
+        "clock": {
+            "offset": lightmix.clock.offset,
+            "skew": lightmix.clock.skew,
+            "delay": lightmix.clock.delay
+        }
+    })
+
+
+@server.route("/status")
+def status(request):
+    """
+    Buffer state, cheap enough to be polled while streaming a show :
+    panel time, queued events (depth), end of the buffered events (buffered_until, client time),
+    buffered time from now (horizon, milliseconds) and remaining capacity.
+    Event adding responses report the same fields, but time and horizon.
+
+    :request: Http Request
+    :return: Http Response
+    """
+    content = {
+        "success": True,
+        "time": lightmix.clock.now(),
+        "horizon": lightmix.horizon()
+    }
+    content.update(admission.status())
+    return requests.Response(code=200, content=content)
+
+
+@server.route("/trace")
+def trace(request):
+    """
+    Hot path trace, in Chrome trace-event format (load it in chrome://tracing or Perfetto).
+    Tracing is disabled by default.
 
-        # Checking that time arent negatives
-        if any(value < 0 for value in [min_ms, max_ms, idle_min_ms, idle_max_ms]):
-            raise ValueError
+    http params:
+      enable (optionnal) - 1 to start tracing, 0 to stop ; the trace is cleared when starting
 
-        min_c = int(parameters["min_c"])
-        max_c = int(parameters["max_c"])
+    :request: Http Request
+    :return: Http Response
+    """
+    parameters = request.params_dict()
+    if "enable" in parameters:
+        tracer.enabled = parameters["enable"] == "1"
+        if tracer.enabled:
+            tracer.clear()
+        return requests.Response(code=200, content={
+            "success": True,
+            "message": "Tracing {}".format("enabled" if tracer.enabled else "disabled")
+        })
+
+    # Not recording the dump itself
+    enabled = tracer.enabled
+    tracer.enabled = False
+    content = tracer.dump()
+    tracer.enabled = enabled
+    return requests.Response(code=200, content=content)
 
-        # Checking that coefficient is beetween 0 and 100
-        if any(value < 0 or value > 100 for value in [min_c, max_c]):
-            raise ValueError
 
-            # Setting values to the lightmix Wanderer object
-        lightmix.wanderer.min_ms = min_ms
-        lightmix.wanderer.max_ms = max_ms
+@server.route("/log")
+def get_log(request):
+    """
+    Last log messages, oldest first. Messages are kept in RAM and written to serial between ticks.
 
-        lightmix.wanderer.idle_min_ms = idle_min_ms
-        lightmix.wanderer.idle_max_ms = idle_max_ms
+    http params:
+      level (optionnal)     - minimum level of the returned messages ; DEBUG, INFO, WARNING or ERROR
+      set_level (optionnal) - minimum level recorded from now on ; DEBUG, INFO, WARNING or ERROR
 
-        lightmix.wanderer.min_c = min_c
-        lightmix.wanderer.max_c = max_c
+    :request: Http Request
+    :return: Http Response
+    """
+    parameters = request.params_dict()
+    levels = {name: level for level, name in log.LEVEL_NAMES.items()}
+    try:
+        level = levels[parameters.get("level", "DEBUG").upper()]
+        if "set_level" in parameters:
+            logger.level = levels[parameters["set_level"].upper()]
+    except KeyError:
+        return requests.Response(code=400, content={"success": False, "message": "Unknown level"})
 
-        # Returning Response
-        return requests.Response(code=200, content={"success": True, "message": "Wanderer updated"})
-    # Failure
-    except:
-        return requests.Response(code=200, content={"success": False, "message": "Wanderer not updated"})
+    return requests.Response(code=200, content={
+        "success": True,
+        "level": log.LEVEL_NAMES[logger.level],
+        "dropped": logger.dropped,
+        "messages": logger.records(level)
+    })
 
 
 @server.route("/delall")
@@ -145,12 +481,52 @@ def delall(request):
     :return: Http Response
     """
     # Emptying queue and current event
-    lightmix.event = None
-    lightmix.queue = ""
+    lightmix.clear()
+    scheduler.wake()
     # Returning Response
     return requests.Response(code=200, content={"success": True, "message": "Cleaned."})
 
 
+@udp_server.command(udp.ADDEVENT)
+def udp_addevent(payload):
+    """
+    Adds packed event records, see event_queue.RECORD_FORMAT
+    :payload: memoryview
+    """
+    lightmix.add_packed_events(payload)
+    scheduler.wake()
+
+
+@udp_server.command(udp.DELALL)
+def udp_delall(payload):
+    """
+    Removes every event
+    :payload: memoryview (empty)
+    """
+    lightmix.clear()
+    scheduler.wake()
+
+
+@udp_server.command(udp.WANDERING)
+def udp_wandering(payload):
+    """
+    Configures the wanderer, see udp.WANDERING
+    :payload: memoryview
+    """
+    lightmix.wanderer.configure(*unpack_from("<4L2B", payload))
+    scheduler.wake()
+
+
+@udp_server.command(udp.CALIBRATE)
+def udp_calibrate(payload):
+    """
+    Sets the time offset, see udp.CALIBRATE
+    :payload: memoryview
+    """
+    lightmix.set_time_offset(unpack_from("<q", payload)[0])
+    scheduler.wake()
+
+
 def wifi_connect():
     """
     Tries to connect to a wifi hotspot using conf files
@@ -187,22 +563,85 @@ def init_wifi():
         access_point.active(True)
 
 
-init_wifi()
-server.run()
-
-# Calculating tick rate
-tick_rate = 50
-tick_duration = int(1000 / tick_rate)
-
-while True:
-    t = time.ticks_ms()
-    # Performing update, clearing queue if failure
+def tick():
+    """
+    Performs a LightMix update. A failed update drops the current event only,
+    the queue is cleared if updates keep failing
+    :return: Int | milliseconds before next change, see LightMix.update. 0 after a failure,
+      so the next due event loads on the next frame
+    """
+    global failures
     try:
-        lightmix.update()
+        next_change = lightmix.update()
+        failures = 0
+        return next_change
     except Exception as e:
+        failures += 1
         sys.print_exception(e)
-        print("Clearing queue")
-        lightmix.event = None
-        lightmix.queue = ""
-    # Calculating wait time according to tick rate
-    time.sleep_ms(tick_duration - (time.ticks_ms() - t))
+        if isinstance(e, MemoryError):
+            gc.collect()
+        if failures < MAX_FAILURES:
+            logger.error("Update failed : {}. Dropping current event", e)
+            lightmix.release_event()
+        else:
+            logger.error("Update failed {} times : {}. Clearing queue", failures, e)
+            lightmix.clear()
+            failures = 0
+        return 0
+
+
+def slack(time_left):
+    """
+    Deferrable work, run between ticks : garbage collection, then writing logs to serial
+    :time_left: Int | microseconds before next deadline
+    """
+    collector.collect(time_left)
+    logger.drain(scheduler.time_left() - collector.margin)
+
+
+async def run_async():
+    """
+    Runs the web server and the tick loop as cooperating tasks on one event loop.
+    Route handlers and updates never run at the same time.
+    """
+    await server.serve()
+    asyncio.create_task(udp_server.serve())
+    if hardware_timer:
+        scheduler.start_timer(lightmix_clock)
+        while True:
+            await asyncio.sleep(3600)
+    else:
+        await scheduler.run_async(asyncio)
+
+
+# Tick rate, in ticks per second
+tick_rate = 50
+# Consecutive failed updates, the queue is cleared when reaching MAX_FAILURES
+failures = 0
+MAX_FAILURES = 3
+# Garbage collections run between ticks, when the frame has time left
+collector = SlackCollector()
+scheduler = TickScheduler(tick, tick_rate, slack=slack)
+
+# Serving through uasyncio if available, else through a blocking thread
+asynchronous = asyncio is not None
+# Ticks driven by lightmix_clock Timer instead of a deadline loop
+hardware_timer = False
+
+
+# Started on boot. Importing the module (host simulator) only sets routes up
+if __name__ == "__main__":
+    init_wifi()
+
+    if asynchronous:
+        asyncio.run(run_async())
+    else:
+        server.run()
+        udp_server.run()
+        if hardware_timer:
+            scheduler.start_timer(lightmix_clock)
+            # Scheduled ticks run while the main thread sleeps
+            while True:
+                time.sleep(3600)
+        else:
+            scheduler.run()
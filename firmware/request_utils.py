@@ -1,12 +1,27 @@
+from log import log
+
+
 def code_string(code):
     global codes
     if code in codes:
         return codes[code]
     else:
-        print("Warning: Response code {} doesn't exist or is not supported".format(code))
+        log.warning("Response code {} doesn't exist or is not supported", code)
         return "Unsupported"
 
 
+def status_line(code):
+    """
+    HTTP/1.1 status line, built once per code
+    :code: Int | status code
+    :return: bytes
+    """
+    line = status_lines.get(code)
+    if line is None:
+        line = status_lines[code] = "HTTP/1.1 {} {}\r\n".format(code, code_string(code)).encode()
+    return line
+
+
 codes = {
     # Informational
     100: "Continue",
@@ -35,7 +50,7 @@ codes = {
     #  402: "Payment Required",
     #  403: "Forbidden",
     404: "Not Found",
-    #  405: "Method Not Allowed",
+    405: "Method Not Allowed",
     #  406: "Not Acceptable",
     #  407: "Proxy Authentication Required",
     #  408: "Request Timeout",
@@ -43,16 +58,23 @@ codes = {
     #  410: "Gone",
     #  411: "Length Required",
     #  412: "Precondition Failed",
-    #  413: "Request Entity Too Large",
+    413: "Request Entity Too Large",
     #  414: "Request-URI Too Long",
     #  415: "Unsupported Media Type",
     #  416: "Requested Range Not Satisfiable",
     #  417: "Expectation Failed",
+    429: "Too Many Requests",
+    431: "Request Header Fields Too Large",
     # Server Error
-    #  500: "Internal Server Error",
+    500: "Internal Server Error",
     #  501: "Not Implemented",
     #  502: "Bad Gateway",
-    #  503: "Service Unavailable",
+    503: "Service Unavailable",
     #  504: "Gateway Timeout",
     #  505: "HTTP Version Not Supported"
-}
\ No newline at end of file
+}
+
+# Status lines of the supported codes, prebuilt
+status_lines = {}
+for code in codes:
+    status_line(code)
@@ -1,7 +1,11 @@
 from machine import Timer
 import socket
-from request_utils import code_string
+from request_utils import status_line
+from stats import Histogram, LATENCY_BOUNDS
+from tracing import tracer, HTTP
+from log import log
 import json
+import time
 from sys import platform
 
 if platform == "esp32":
@@ -9,144 +13,622 @@ if platform == "esp32":
 else:
   thread = None
 
+try:
+  import uasyncio as asyncio
+except ImportError:
+  try:
+    import asyncio
+  except ImportError:
+    asyncio = None
+
+PARSE_SPAN = tracer.span("request parsing", HTTP)
+DISPATCH_SPAN = tracer.span("route", HTTP)
+RENDER_SPAN = tracer.span("Response.render", HTTP)
+FEED_SPAN = tracer.span("Response.feed", HTTP)
 
 class WebServer:
-  def __init__(self):
+  def __init__(self, port=80):
     """
     WebServer
     Decorates routes functions as @obj_name.route("route")
+    :port: Int | listening port
     """
     self.routes_register = {}
-    self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    self.socket.bind(('', 80))
-    self.socket.listen(5)
+    # Accepted methods per route, None for any
+    self.routes_methods = {}
+    # Prefix routes names, longest first
+    self.prefixes = []
+    # Requests count and latency (microseconds) per route
+    self.routes_stats = {}
+    # Body consumers of streamed routes : route name -> (record size, function)
+    self.streams = {}
+    # Consumers of "&&" chained queries longer than the head buffer : route name -> function
+    self.query_streams = {}
+    self.port = port
+    # Largest accepted request head and body, in bytes. Streamed bodies and queries aren't limited
+    self.max_head = 1024
+    self.max_body = 8192
+    # Size of the buffers streamed bodies are received into, and responses are assembled into
+    self.chunk_size = 1024
+    self.send_size = 1024
+    # Reused by the blocking server, allocated on the first request
+    self._head = None
+    self._chunk = None
+    self._send = None
+    # Seconds given to a client to send its request (asynchronous mode)
+    self.timeout = 5
+    # Persistent connections (asynchronous mode) : idle seconds before closing, and maximum count
+    self.keep_alive_timeout = 10
+    self.max_connections = 4
+    self.connections = 0
+    self.debug = True
+    self.socket = None
 
-  def route(self, name):
+  def route(self, name, methods=None, prefix=False):
     """
     Used as a decorator to register routes.
+    :name: Str | route path
+    :methods: Tuple of Str | accepted methods, any if None. Others are answered with 405
+    :prefix: Boolean | also match every path starting with name. The longest prefix matches first
     """
 
     def func_wrapper(func):
       self.routes_register[name] = func
+      self.routes_methods[name] = methods
+      self.routes_stats[name] = Histogram(LATENCY_BOUNDS)
+      if prefix:
+        self.prefixes.append(name)
+        self.prefixes.sort(key=len, reverse=True)
       return func
 
     return func_wrapper
 
+  def resolve(self, path):
+    """
+    Finds the route serving a path : direct lookup, then prefix routes
+    :path: Str
+    :return: Str | route name, None if there is none
+    """
+    if path in self.routes_register:
+      return path
+    for prefix in self.prefixes:
+      if path.startswith(prefix):
+        return prefix
+    return None
+
+  def allows(self, name, method):
+    """
+    :return: Boolean | whether route name accepts method
+    """
+    methods = self.routes_methods[name]
+    return methods is None or method in methods
+
+  def stream(self, name, size=1):
+    """
+    Used as a decorator to register the body consumer of a route.
+    The body isn't stored : it is handed to the consumer as it is received, in chunks
+    holding whole records, so peak memory doesn't depend on the body size.
+    The consumer is called as func(request, chunk), chunk being a memoryview only valid
+    during the call, and the last chunk may hold a partial record. The route runs afterwards,
+    with an empty body. request.state is free for the consumer to keep its results.
+    :name: Str | route name
+    :size: Int | record size, in bytes
+    """
+
+    def func_wrapper(func):
+      self.streams[name] = (size, func)
+      return func
+
+    return func_wrapper
+
+  def stream_for(self, r):
+    """
+    Body consumer of the route serving a request
+    :r: HTTPRequestParser
+    :return: Tuple (record size, consumer), None if the body isn't streamed
+    """
+    route = self.resolve(r.path)
+    if route is None or not self.allows(route, r.method):
+      return None
+    return self.streams.get(route)
+
+  def stream_query(self, name):
+    """
+    Used as a decorator to register the query consumer of a route, for queries chaining elements with "&&".
+    Queries longer than the head buffer are handed to the consumer as they are received, in chunks
+    of whole elements, and only the last elements are left in the head. The request isn't parsed yet :
+    the consumer is called as func(state, chunk), chunk being a memoryview only valid during the call,
+    holding whole elements separated by "&&". It returns the new state (None at first), which the route
+    finds in request.state. Queries fitting in the head buffer aren't handed to the consumer.
+    :name: Str | route name
+    """
+
+    def func_wrapper(func):
+      self.query_streams[name] = func
+      return func
+
+    return func_wrapper
+
+  def cut_query(self, buffer, received, state):
+    """
+    Hands the whole elements of a chained query filling the head buffer to the route query consumer,
+    then moves the rest of the query back after "?". See stream_query.
+    :buffer: bytearray | head buffer
+    :received: Int | bytes received into buffer
+    :state: query consumer state
+    :return: Tuple (bytes left in buffer, state)
+    Raises ValueError if the head can't be streamed : request line complete, no query consumer or no whole element
+    """
+    data = bytes(buffer[:received])
+    first = data.find(b" ")
+    query = data.find(b"?", first + 1)
+    cut = data.rfind(b"&&")
+    if data.find(b"\r\n") >= 0 or first <= 0 or query < 0 or cut <= query:
+      raise ValueError("Request head too large")
+    route = self.resolve(data[first + 1:query].decode())
+    if route not in self.query_streams or not self.allows(route, data[:first].decode()):
+      raise ValueError("Request head too large")
+    state = self.query_streams[route](state, memoryview(buffer)[query + 1:cut])
+    # Rest of the query, not a whole element yet
+    left = received - cut - 2
+    buffer[query + 1:query + 1 + left] = buffer[cut + 2:received]
+    return query + 1 + left, state
+
+  def dispatch(self, r):
+    """
+    Executes the route matching the request
+    :r: HTTPRequestParser
+    :return: Response
+    """
+    route = self.resolve(r.path)
+    # 404 response if couldn't find any matching route
+    if route is None:
+      return Response(code=404, content="<h1>Not Found</h1><p>Ressources could not be located or doesn't exists</p>")
+    if not self.allows(route, r.method):
+      return Response(code=405, content={
+        "success": False,
+        "message": "{} only".format(", ".join(self.routes_methods[route]))
+      })
+
+    # Executing route
+    start = time.ticks_us()
+    tracer.begin(DISPATCH_SPAN)
+    try:
+      return self.routes_register[route](r)
+    # If route failed to be executed, returning error 500
+    except:
+      return Response(code=500,
+                      content="<h1>Internal Server Error</h1><p>The server encountered an internal error and was unable to complete your request.</p>")
+    finally:
+      tracer.end(DISPATCH_SPAN)
+      self.routes_stats[route].add(time.ticks_diff(time.ticks_us(), start))
+
   def run(self, debug=True, threaded=True):
     """
+    Blocking accept loop, handling one client at a time
     :debug: Boolean | Log the connections 
-    :asynchronous: Boolean | 
+    :threaded: Boolean | Run the loop in a new thread when available
     """
     if threaded:
       if thread:
         thread.start_new_thread(self.run, (debug, False))
         return
 
+    self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.socket.bind(('', self.port))
+    self.socket.listen(5)
+
     while True:
       # Waiting for client connection
       client, addr = self.socket.accept()
       if debug:
-        print('[WebServer] Got a connection from {}'.format(addr))
-
-      # Receiving a full request. May lead to memory error if request to large
-      try:
-        buffer = client.recv(1024)
-      except Exception as err:
-        print("[WebServer] Exception: {}".format(err))
-        client.close()
-
-        # Try to parse received requests.
-      try:
-        r = HTTPRequestParser(buffer)
-      except:
-        print("[WebServer] Improperly formatted request : {}".format(buffer))
-        client.sendall('Connection: close\n\n')
-        client.close()
-        continue
-
-      feeded = False
-
-      # Looking for a route
-      for route in self.routes_register:
-        if r.path == route:
-          # Executing route if found a match
-          try:
-            response = self.routes_register[route](r)
-          # If route failed to be executed, returning error 500
-          except:
-            response = Response(code=500,
-                                content="<h1>Internal Server Error</h1><p>The server encountered an internal error and was unable to complete your request.</p>")
-
-          # Sending response
-          response.feed(client, addr)
-          feeded = True
-          break
+        log.info("[WebServer] Got a connection from {}", addr)
+      self.handle(client, addr)
+
+  def handle(self, client, addr="Unknown"):
+    """
+    Answers a single request then closes the connection (blocking mode)
+    :client: socket
+    :addr: client address, for logs
+    """
+    # Receive buffers, reused by every request
+    if self._head is None:
+      self._head = bytearray(self.max_head)
+      self._chunk = bytearray(self.chunk_size)
+      self._send = bytearray(self.send_size)
+
+    # Receiving the request head
+    try:
+      buffer, state = self.read_head(client)
+    except ValueError:
+      Response(code=431, content=self.head_too_large(), feed=client)
+      return
+    except Exception as err:
+      log.error("[WebServer] Exception: {}", err)
+      client.close()
+      return
+    if not buffer:
+      client.close()
+      return
+
+    # Try to parse received requests.
+    try:
+      r = HTTPRequestParser(buffer)
+    except:
+      log.warning("[WebServer] Improperly formatted request : {}", buffer)
+      client.sendall('Connection: close\n\n')
+      client.close()
+      return
+    r.state = state
+
+    # Receiving the rest of the body, if any. Streamed bodies are consumed while received
+    try:
+      stream = self.stream_for(r)
+      if stream:
+        self.stream_body(client, r, stream)
+      else:
+        self.read_body(client, r)
+    except ValueError:
+      Response(code=413, content="<h1>Request Entity Too Large</h1>", feed=client)
+      return
+    except Exception as err:
+      log.error("[WebServer] Exception: {}", err)
+      client.close()
+      return
+
+    self.dispatch(r).feed(client, addr, self._send)
+
+  async def serve(self, debug=True):
+    """
+    Starts serving on the running (u)asyncio event loop, then returns.
+    Clients are handled concurrently, as tasks cooperating with the rest of the application.
+    Connections are kept alive (HTTP/1.1) and may pipeline requests.
+    :debug: Boolean | Log the connections
+    :return: asyncio Server
+    """
+    self.debug = debug
+    return await asyncio.start_server(self.handle_client, '0.0.0.0', self.port, backlog=5)
+
+  async def handle_client(self, reader, writer):
+    """
+    Handles a persistent client connection (asynchronous mode).
+    Pipelined requests are answered in order, idle connections are closed after keep_alive_timeout.
+    :reader: asyncio StreamReader
+    :writer: asyncio StreamWriter
+    """
+    addr = writer.get_extra_info('peername')
+    if self.debug:
+      log.info("[WebServer] Got a connection from {}", addr)
+
+    self.connections += 1
+    # Connections over the limit are served once then closed
+    keep_alive = self.connections <= self.max_connections
+    # Receive buffers kept for the connection : head (then pipelined bytes) and streamed body chunks
+    head = bytearray(self.max_head)
+    view = memoryview(head)
+    received = 0
+    chunk_buffer = None
+    try:
+      while True:
+        # Receiving a full head. Idle connections are reaped by the timeout
+        head_end = bytes(view[:received]).find(b"\r\n\r\n") if received else -1
+        state = None
+        while head_end < 0:
+          if received == len(head):
+            # Only chained queries may be longer than the buffer
+            try:
+              received, state = self.cut_query(head, received, state)
+            except ValueError:
+              writer.write(Response(code=431, content=self.head_too_large()).render())
+              await writer.drain()
+              return
+          timeout = self.timeout if received else self.keep_alive_timeout
+          n = await self.read_into(reader, view[received:], timeout)
+          if not n:
+            return
+          # Looking for the end of the head in the new bytes only
+          start = max(0, received - 3)
+          received += n
+          head_end = bytes(view[start:received]).find(b"\r\n\r\n")
+          if head_end >= 0:
+            head_end += start
 
-      # Feeding client with a 404 response if couldn't find any matching response
-      if not feeded:
         try:
-          Response(code=404, content="<h1>Not Found</h1><p>Ressources could not be located or doesn't exists</p>",
-                   feed=client)
+          r = HTTPRequestParser(bytes(view[:head_end + 4]))
         except:
-          print("[WebServer] Connection error")
+          log.warning("[WebServer] Improperly formatted request : {}", bytes(view[:head_end]))
+          return
+        r.state = state
+        position = head_end + 4
+
+        # Receiving the body, framed by Content-Length
+        length = int(r.header("Content-Length", 0))
+        # Body bytes received with the head
+        early = min(length, received - position)
+        stream = self.stream_for(r)
+        if stream:
+          # Consumed while received
+          if chunk_buffer is None:
+            chunk_buffer = bytearray(self.chunk_size)
+          body = BodyStream(chunk_buffer, r, *stream)
+          body.write(view[position:position + early])
+          remaining = length - early
+          while remaining > 0:
+            space = body.space()
+            n = await self.read_into(reader, space[:min(len(space), remaining)], self.timeout)
+            if not n:
+              return
+            body.commit(n)
+            remaining -= n
+          body.flush()
+          r.body = b""
+          response = self.dispatch(r)
+          keep_alive = keep_alive and r.keep_alive
+        elif length > self.max_body:
+          response = Response(code=413, content="<h1>Request Entity Too Large</h1>")
+          keep_alive = False
+        else:
+          body = bytearray(length)
+          body_view = memoryview(body)
+          body_view[:early] = view[position:position + early]
+          filled = early
+          while filled < length:
+            n = await self.read_into(reader, body_view[filled:], self.timeout)
+            if not n:
+              return
+            filled += n
+          r.body = body_view
+          response = self.dispatch(r)
+          keep_alive = keep_alive and r.keep_alive
+
+        # Pipelined bytes moved to the front of the head buffer
+        position += early
+        head[:received - position] = head[position:received]
+        received -= position
+
+        writer.write(response.render(keep_alive))
+        # Pipelined responses are flushed together
+        if not received or not keep_alive:
+          await writer.drain()
+        if not keep_alive:
+          break
+    except asyncio.TimeoutError:
+      # Idle or stalled connection, reaping it
+      pass
+    except Exception as err:
+      log.error("[WebServer] Exception: {}", err)
+    finally:
+      self.connections -= 1
+      writer.close()
+      await writer.wait_closed()
+      if self.debug:
+        log.info("[WebServer] Ended connection with {}", addr)
+
+  def head_too_large(self):
+    """
+    Content of 431 responses. Only bodies (see stream) and chained queries (see stream_query) are streamed
+    """
+    return "<h1>Request Header Fields Too Large</h1><p>Heads are limited to {} bytes, chained queries excepted</p>".format(
+      self.max_head)
+
+  async def read_into(self, reader, view, timeout):
+    """
+    Receives bytes into a buffer (asynchronous mode), without allocating when the stream supports readinto
+    :reader: asyncio StreamReader
+    :view: memoryview | free part of the buffer
+    :timeout: Int | seconds
+    :return: Int | number of bytes received, 0 if the client left
+    """
+    readinto = getattr(reader, "readinto", None)
+    if readinto:
+      return await asyncio.wait_for(readinto(view), timeout)
+    data = await asyncio.wait_for(reader.read(len(view)), timeout)
+    view[:len(data)] = data
+    return len(data)
+
+  def read_head(self, client):
+    """
+    Receives a request head into the preallocated head buffer, whatever the number of segments.
+    Chained queries longer than the buffer are handed to the route query consumer meanwhile, see stream_query.
+    :client: socket
+    :return: Tuple (bytes, state) | head, followed by the beginning of the body if any, empty if the client left,
+      and the query consumer state
+    Raises ValueError if the head doesn't fit into max_head bytes
+    """
+    view = memoryview(self._head)
+    readinto = getattr(client, "readinto", None) or client.recv_into
+    received = 0
+    state = None
+    while True:
+      n = readinto(view[received:])
+      if not n:
+        return b"", state
+      # Looking for the end of the head in the new bytes only
+      start = max(0, received - 3)
+      received += n
+      data = bytes(view[:received])
+      if data.find(b"\r\n\r\n", start) >= 0:
+        return data, state
+      if received == len(view):
+        received, state = self.cut_query(self._head, received, state)
+
+  def stream_body(self, client, request, stream):
+    """
+    Hands the body to a streamed route consumer, chunk by chunk, as it is received
+    into the preallocated chunk buffer. See stream.
+    :client: socket
+    :request: HTTPRequestParser
+    :stream: Tuple (record size, consumer)
+    """
+    length = int(request.header("Content-Length", 0))
+    body = BodyStream(self._chunk, request, *stream)
+    # Body bytes received with the head
+    body.write(request.body[:length])
+    received = min(len(request.body), length)
+    readinto = getattr(client, "readinto", None) or client.recv_into
+    while received < length:
+      space = body.space()
+      n = readinto(space[:min(len(space), length - received)])
+      if not n:
+        break
+      received += n
+      body.commit(n)
+    body.flush()
+    request.body = b""
+
+  def read_body(self, client, request):
+    """
+    Completes request.body according to the Content-Length header.
+    The body is received into a single preallocated buffer.
+    :client: socket
+    :request: HTTPRequestParser
+    """
+    length = int(request.header("Content-Length", 0))
+    received = len(request.body)
+    if length <= received:
+      return
+    if length > self.max_body:
+      raise ValueError("Request body too large")
+
+    body = bytearray(length)
+    view = memoryview(body)
+    view[:received] = request.body
+    readinto = getattr(client, "readinto", None) or client.recv_into
+    while received < length:
+      n = readinto(view[received:])
+      if not n:
+        break
+      received += n
+    request.body = view[:received]
+
+
+class BodyStream:
+  def __init__(self, buffer, request, size, consumer):
+    """
+    Cuts a request body into chunks of whole records, handed to a consumer as soon as they are full.
+    :buffer: bytearray | chunk buffer, reused
+    :request: HTTPRequestParser | passed to the consumer
+    :size: Int | record size, in bytes
+    :consumer: Callable | func(request, chunk), see WebServer.stream
+    """
+    self.view = memoryview(buffer)
+    # Chunks hold whole records
+    self.usable = len(buffer) - len(buffer) % size
+    self.pending = 0
+    self.request = request
+    self.consumer = consumer
+
+  def space(self):
+    """
+    Free part of the buffer, to receive into directly. See commit
+    :return: memoryview
+    """
+    return self.view[self.pending:self.usable]
+
+  def commit(self, n):
+    """
+    Accounts for n bytes received into space()
+    """
+    self.pending += n
+    if self.pending == self.usable:
+      self.flush()
+
+  def write(self, data):
+    """
+    Copies received body bytes
+    :data: bytes or memoryview
+    """
+    start = 0
+    while start < len(data):
+      n = min(self.usable - self.pending, len(data) - start)
+      self.view[self.pending:self.pending + n] = data[start:start + n]
+      start += n
+      self.commit(n)
+
+  def flush(self):
+    """
+    Hands the pending bytes to the consumer, the last chunk may hold a partial record
+    """
+    if self.pending:
+      self.consumer(self.request, self.view[:self.pending])
+      self.pending = 0
 
 
 class HTTPRequestParser:
   def __init__(self, r):
     """
-    HTTP Request class. All elements callables
-    :r: bytes | raw http request
+    HTTP Request class, parsed lazily.
+    Only the request line is read here, in a single scan of the raw bytes. The query,
+    parameters and headers are decoded when first accessed, the body is a view on the raw bytes.
+    :r: bytes | raw http request (head, then the beginning of the body if any)
+    Raises ValueError if the request line is malformed
     """
-    # Splitting Lines
-    r = r.decode()
-    r = r.split("\r\n")
+    tracer.begin(PARSE_SPAN)
+    self._raw = r
+    # Separating head from body, the body may be binary
+    head_end = r.find(b"\r\n\r\n")
+    if head_end < 0:
+      head_end = len(r)
+      self.body = b""
+    else:
+      self.body = memoryview(r)[head_end + 4:]
+    self._head_end = head_end
 
-    # Getting Method, Path and Protocol from first header
-    self.method, self.path, self.protocol = r.pop(0).split()
+    # Request line : method, path (and query), protocol
+    line_end = r.find(b"\r\n", 0, head_end)
+    if line_end < 0:
+      line_end = head_end
+    first = r.find(b" ", 0, line_end)
+    second = r.find(b" ", first + 1, line_end)
+    if first <= 0 or second < 0:
+      tracer.end(PARSE_SPAN)
+      raise ValueError("Malformed request line")
+    self._line_end = line_end
 
-    try:
-      self.raw_params = self.path.split("?")[1]
-    except:
-      self.raw_params = None
-
-    # Parsing URL parameters
-    self.parameters = self.parse_parameters()
-    self.path = self.path.split("?")[0]
-    # Parsing other headers as Name: Value
-    self.headers = self.parse_headers(r)
-
-  def parse_headers(self, header_list):
-    """
-    :header_list: list, Http request without method/path/protocol, splitted by lines
-    :return: Dict ; headers by name: value
-    """
-    headers = {}
-    for header in header_list:
-      try:
-        # Seperating header strings as name: value
-        slices = header.split(": ", 1)
-        headers[slices[0]] = slices[1]
-      except:
-        # Some headers may be improperly formatted. Ignoring them.
-        pass
-    return headers
+    query = r.find(b"?", first + 1, second)
+    self.method = r[:first].decode()
+    self.path = r[first + 1:second if query < 0 else query].decode()
+    self.protocol = r[second + 1:line_end].decode()
+    self._query = None if query < 0 else (query + 1, second)
+
+    # Decoded on access
+    self._raw_params = None
+    self._parameters = None
+    self._params_dict = None
+    self._headers = None
+    # Free for streamed body consumers, see WebServer.stream
+    self.state = None
+    tracer.end(PARSE_SPAN)
+
+  @property
+  def raw_params(self):
+    """
+    Query string, without "?"
+    :return: Str or None if the request has no query
+    """
+    if self._raw_params is None and self._query is not None:
+      start, end = self._query
+      self._raw_params = self._raw[start:end].decode()
+    return self._raw_params
+
+  @property
+  def parameters(self):
+    """
+    List of tuples (key, value). Key of value may be empty
+    """
+    if self._parameters is None:
+      self._parameters = self.parse_parameters()
+    return self._parameters
 
   def parse_parameters(self):
     """
     Returns: List of tuples. Key of value may be empty
     """
     formatted_parameters = []
-
-    parameters = self.path.split("?")
-
-    # Checking if parameters are present
-    if len(parameters) > 1:
-      parameters = parameters[1]
-      # Splitting parameters into fragments 
-      fragments = parameters.split("&")
-      # Adding fragments to the returned list
-      for frag in fragments:
+    if self.raw_params:
+      # Splitting parameters into fragments
+      for frag in self.raw_params.split("&"):
         key_value = frag.split("=", 1)
         # Parameters doesn't have value
         if len(key_value) == 1:
@@ -157,20 +639,85 @@ class HTTPRequestParser:
     return formatted_parameters
 
   def params_dict(self):
-    return {k: v for k, v in self.parameters}
+    if self._params_dict is None:
+      if self._parameters is None and self.raw_params:
+        # Building the dict directly, without the list of tuples
+        self._params_dict = {}
+        for frag in self.raw_params.split("&"):
+          key_value = frag.split("=", 1)
+          self._params_dict[key_value[0]] = key_value[1] if len(key_value) == 2 else ''
+
+      else:
+        self._params_dict = {k: v for k, v in self.parameters}
+    return self._params_dict
+
+  def header(self, name, default=None):
+    """
+    Case insensitive header lookup, scanning the raw head
+    :name: Str ; header name
+    :return: Str ; header value or default
+    """
+    r = self._raw
+    name = name.lower().encode()
+    size = len(name)
+    position = self._line_end + 2
+    while position < self._head_end:
+      end = r.find(b"\r\n", position, self._head_end)
+      if end < 0:
+        end = self._head_end
+      if r[position + size:position + size + 1] == b":" and r[position:position + size].lower() == name:
+        return r[position + size + 1:end].decode().strip()
+      position = end + 2
+    return default
+
+  @property
+  def headers(self):
+    """
+    Every header, as a dict of name: value. Improperly formatted headers are ignored
+    """
+    if self._headers is None:
+      self._headers = {}
+      head = self._raw[self._line_end + 2:self._head_end].decode()
+      for line in head.split("\r\n"):
+        slices = line.split(":", 1)
+        if len(slices) == 2:
+          self._headers[slices[0]] = slices[1].strip()
+    return self._headers
+
+  @property
+  def keep_alive(self):
+    """
+    Whether the client asks to keep the connection open
+    :return: Boolean
+    """
+    connection = (self.header("Connection") or "").lower()
+    if self.protocol == "HTTP/1.0":
+      return connection == "keep-alive"
+    return connection != "close"
+
+
+# Prebuilt header lines
+CONTENT_TYPES = {
+  "application/json": b"Content-Type: application/json\r\n",
+  "text/html": b"Content-Type: text/html\r\n",
+  "text/plain": b"Content-Type: text/plain\r\n"
+}
+CONNECTION = (b"Connection: close\r\n\r\n", b"Connection: keep-alive\r\n\r\n")
 
 
 class Response:
-  def __init__(self, code=200, content_type="auto", content="Hello world", feed=None):
+  def __init__(self, code=200, content_type="auto", content="Hello world", feed=None, headers=None):
     """
     Response object. can be used to build HTTP responses
     :code: Int ; Status code
     :content_type: Str ; content type
     :content: Str (html/text) or Dict (json/applications)
+    :headers: Dict ; additional headers, name: value
     """
     self._code = code
     self._content_type = content_type
     self._content = content
+    self._headers = headers
 
     if feed:
       self.feed(feed)
@@ -180,18 +727,36 @@ class Response:
     """
     Ready to use code header
     """
-    return 'HTTP/1.1 {} {}\n'.format(self._code, code_string(self._code))
+    return status_line(self._code).decode()
 
   @property
   def content_type(self):
     """
     Ready to use content-type header
     """
-    if self._content_type == "auto":
-      if isinstance(self._content, dict):
-        return 'Content-Type: application/json\n'
-      else:
-        return 'Content-Type: text/html\n'
+    return self.content_type_header().decode()
+
+  def content_type_header(self):
+    """
+    Content-type header, prebuilt for the usual types
+    :return: bytes
+    """
+    content_type = self._content_type
+    if content_type == "auto":
+      content_type = "application/json" if isinstance(self._content, dict) else "text/html"
+    header = CONTENT_TYPES.get(content_type)
+    if header is None:
+      header = 'Content-Type: {}\r\n'.format(content_type).encode()
+    return header
+
+  def extra_headers(self):
+    """
+    Additional header lines
+    :return: bytes
+    """
+    if not self._headers:
+      return b""
+    return "".join("{}: {}\r\n".format(name, value) for name, value in self._headers.items()).encode()
 
   @property
   def content(self):
@@ -203,18 +768,46 @@ class Response:
     else:
       return self._content
 
-  def feed(self, client, addr="Unknown"):
+  def render(self, keep_alive=False, buffer=None):
+    """
+    Full HTTP response, ready to be sent
+    :keep_alive: Boolean ; keep the connection open after this response
+    :buffer: bytearray ; assembles the response into it when it fits, instead of allocating
+    :return: bytes, or memoryview on buffer, only valid until the buffer is reused
+    """
+    tracer.begin(RENDER_SPAN)
+    content = self.content
+    if isinstance(content, str):
+      content = content.encode()
+    parts = (status_line(self._code), self.content_type_header(), self.extra_headers(), b"Content-Length: ",
+             str(len(content)).encode(), b"\r\n", CONNECTION[1 if keep_alive else 0], content)
+    size = 0
+    for part in parts:
+      size += len(part)
+    if buffer is None or size > len(buffer):
+      response = b"".join(parts)
+    else:
+      response = memoryview(buffer)
+      position = 0
+      for part in parts:
+        response[position:position + len(part)] = part
+        position += len(part)
+      response = response[:size]
+    tracer.end(RENDER_SPAN)
+    return response
+
+  def feed(self, client, addr="Unknown", buffer=None):
     """
-    Sends a response to specified client then close it
+    Sends a response to specified client, with a single sendall, then close it
+    :buffer: bytearray ; reused to assemble the response, see render
     """
+    tracer.begin(FEED_SPAN)
     try:
-      client.send(self.code)
-      client.send(self.content_type)
-      client.send('Connection: close\n\n')
-      client.sendall(self.content)
+      client.sendall(self.render(buffer=buffer))
     except Exception as e:
-      print("[WebServer] Error ({})".format(e))
+      log.error("[WebServer] Error ({})", e)
     else:
-      print("[WebServer] Ended connection with {}".format(addr))
+      log.info("[WebServer] Ended connection with {}", addr)
     finally:
       client.close()
+      tracer.end(FEED_SPAN)
@@ -0,0 +1,190 @@
+import time
+from stats import Histogram, TICK_BOUNDS
+
+try:
+    import micropython
+except ImportError:
+    micropython = None
+
+
+class TickScheduler:
+    def __init__(self, callback, rate=50, max_idle=1000, slack=None):
+        """
+        Deadline driven tick scheduler.
+        Ticks target absolute deadlines (start + n * period) so errors don't accumulate.
+        When a tick overruns past the next deadline, missed frames are skipped
+        and the schedule stays aligned on the original grid.
+
+        The callback may return the number of milliseconds before it needs to run again
+        (None if nothing is scheduled) : the scheduler then sleeps until then, or until wake() is called.
+
+        :callback: Callable | function called on every tick
+        :rate: Int | ticks per second
+        :max_idle: Int | maximum time between two ticks, in milliseconds
+        :slack: Callable | called after every tick with the time left before the next deadline
+          (in microseconds), to run deferrable work such as garbage collection
+        """
+        self.callback = callback
+        self.slack = slack
+        self.period = 1000000 // rate  # microseconds
+        self.max_idle = max_idle
+        self.deadline = time.ticks_us()
+
+        # Counters
+        self.ticks = 0
+        self.missed = 0  # overruns, ticks that started after the next deadline
+        self.skipped = 0  # frames dropped because of overruns
+        self.idle = 0  # frames not run because nothing changed
+        self.late = 0  # lateness of the last tick, in microseconds
+        self.max_late = 0
+        # Callback durations and lateness (jitter), in microseconds
+        self.durations = Histogram(TICK_BOUNDS)
+        self.jitter = Histogram(TICK_BOUNDS)
+
+        self._timer = None
+        self._pending = False
+        self._woken = False
+        self._wake = None
+
+    def time_left(self):
+        """
+        Time left before next deadline, in microseconds. Negative when late.
+        """
+        return time.ticks_diff(self.deadline, time.ticks_us())
+
+    def wake(self):
+        """
+        Runs next tick on the next frame. Called when a command changed the state.
+        """
+        self._woken = True
+        if self._wake:
+            self._wake.set()
+
+    def _resume(self):
+        """
+        Cuts an idle sleep short after a wake up : the deadline moves back to the next frame of the grid.
+        A deadline already within a frame is kept.
+        """
+        self._woken = False
+        left = self.time_left()
+        if left > self.period:
+            # Idle frames counted when going to sleep, but not slept
+            frames = left // self.period
+            self.idle -= frames
+            self.deadline = time.ticks_add(self.deadline, -frames * self.period)
+
+    def tick(self):
+        """
+        Runs a tick now and moves the deadline to the next frame
+        """
+        # The callback sees the commands received so far
+        self._woken = False
+        late = -self.time_left()
+        if late >= self.period:
+            # Overrun : skipping frames to stay on the grid
+            frames = late // self.period
+            self.missed += 1
+            self.skipped += frames
+            self.deadline = time.ticks_add(self.deadline, frames * self.period)
+            late -= frames * self.period
+        self.late = late
+        if late > self.max_late:
+            self.max_late = late
+        self.jitter.add(late)
+
+        self.ticks += 1
+        start = time.ticks_us()
+        next_change = self.callback()
+        self.durations.add(time.ticks_diff(time.ticks_us(), start))
+
+        # Sleeping as many frames as possible when nothing changes
+        frames = 1
+        if next_change is None or next_change > self.max_idle:
+            next_change = self.max_idle
+        if next_change * 1000 > self.period:
+            frames = next_change * 1000 // self.period
+            self.idle += frames - 1
+        self.deadline = time.ticks_add(self.deadline, frames * self.period)
+
+        if self.slack:
+            self.slack(self.time_left())
+
+    def run(self):
+        """
+        Blocking tick loop
+        """
+        self.deadline = time.ticks_us()
+        while True:
+            # Sleeping at most a frame at once, to check for wake ups
+            wait = self.time_left()
+            while wait > 0:
+                if self._woken:
+                    self._resume()
+                    wait = self.time_left()
+                time.sleep_us(min(wait, self.period))
+                wait = self.time_left()
+            self.tick()
+
+    async def run_async(self, asyncio):
+        """
+        Tick loop as a (u)asyncio task, yielding to other tasks until next deadline
+        :asyncio: module | uasyncio or asyncio
+        """
+        self._wake = asyncio.Event()
+        self.deadline = time.ticks_us()
+        while True:
+            if self._woken:
+                self._resume()
+            wait = self.time_left()
+            if wait > self.period:
+                # Idle, sleeping until next deadline or wake up
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), wait / 1000000)
+                except asyncio.TimeoutError:
+                    pass
+                if self._woken:
+                    self._resume()
+                wait = self.time_left()
+            # Sleeping in milliseconds, rounding down to keep ahead of the deadline
+            await asyncio.sleep_ms(wait // 1000 if wait > 0 else 0)
+            wait = self.time_left()
+            if wait > 0:
+                time.sleep_us(wait)
+            self.tick()
+
+    def start_timer(self, timer):
+        """
+        Drives ticks from a hardware timer. The interrupt only schedules the tick
+        with micropython.schedule, which runs it as soon as the interpreter can.
+        :timer: machine.Timer
+        """
+        self._timer = timer
+        self.deadline = time.ticks_us()
+        timer.init(period=self.period // 1000, mode=timer.PERIODIC, callback=self._interrupt)
+
+    def stop_timer(self):
+        if self._timer:
+            self._timer.deinit()
+            self._timer = None
+
+    def _interrupt(self, timer):
+        # Previous tick still running or waiting : this frame is skipped by tick()
+        if self._pending:
+            return
+        self._pending = True
+        try:
+            micropython.schedule(self._scheduled, None)
+        except RuntimeError:
+            # Schedule queue full
+            self._pending = False
+
+    def _scheduled(self, arg):
+        try:
+            # Idle frames are skipped until woken up
+            if self._woken:
+                self._resume()
+            if self.time_left() < self.period // 2:
+                self.tick()
+        finally:
+            self._pending = False
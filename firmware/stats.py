@@ -0,0 +1,54 @@
+from array import array
+
+# Histogram bounds, in microseconds
+TICK_BOUNDS = (250, 500, 1000, 2000, 5000, 10000, 20000, 50000)
+LATENCY_BOUNDS = (1000, 2000, 5000, 10000, 20000, 50000, 100000, 500000)
+
+
+class Histogram:
+    def __init__(self, bounds):
+        """
+        Fixed buckets histogram, cheap enough to be fed on every tick.
+        Bucket i counts values below bounds[i] (and above bounds[i - 1]),
+        the last bucket counts values above every bound.
+        :bounds: Sequence of Int | increasing bucket bounds
+        """
+        self.bounds = array("l", bounds)
+        self.counts = array("L", [0] * (len(bounds) + 1))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        """
+        Counts a value. Doesn't allocate
+        :value: Int
+        """
+        i = 0
+        size = len(self.bounds)
+        while i < size and value >= self.bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def as_dict(self):
+        """
+        :return: Dict | bounds, counts, count, mean and max, ready to be sent as json
+        """
+        return {
+            "bounds": list(self.bounds),
+            "counts": list(self.counts),
+            "count": self.count,
+            "mean": self.total // self.count if self.count else 0,
+            "max": self.max
+        }
@@ -0,0 +1,93 @@
+import time
+from array import array
+
+# Record phases
+BEGIN = 0
+END = 1
+
+# Threads shown in the trace : tick loop and web server
+TICK = 1
+HTTP = 2
+
+
+class Tracer:
+    def __init__(self, capacity=256):
+        """
+        Hot path tracer. Spans are written as fixed-size begin/end records
+        (timestamp, span id, phase) into preallocated ring arrays, the oldest
+        records being overwritten. Recording doesn't allocate, and costs a single
+        attribute test while disabled.
+        The ring can be dumped in Chrome trace-event format (chrome://tracing, Perfetto).
+
+        :capacity: Int | number of records kept
+        """
+        self.capacity = capacity
+        self.enabled = False
+        self.times = array("l", [0] * capacity)
+        self.spans = bytearray(capacity)
+        self.phases = bytearray(capacity)
+        self._next = 0
+        self._count = 0
+        # Span names and threads, by span id
+        self.names = []
+        self.threads = bytearray()
+
+    def span(self, name, thread=TICK):
+        """
+        Registers a span name, at import time
+        :name: Str | span name
+        :thread: Int | TICK or HTTP
+        :return: Int | span id
+        """
+        self.names.append(name)
+        self.threads.append(thread)
+        return len(self.names) - 1
+
+    def begin(self, span):
+        if self.enabled:
+            self._record(span, BEGIN)
+
+    def end(self, span):
+        if self.enabled:
+            self._record(span, END)
+
+    def _record(self, span, phase):
+        i = self._next
+        self.times[i] = time.ticks_us()
+        self.spans[i] = span
+        self.phases[i] = phase
+        self._next = (i + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+
+    def dump(self):
+        """
+        Records from oldest to newest, in Chrome trace-event format.
+        Timestamps are unwrapped relative to the oldest record.
+        :return: Dict | ready to be sent as json
+        """
+        events = []
+        first = (self._next - self._count) % self.capacity
+        previous = self.times[first]
+        ts = 0
+        for n in range(self._count):
+            i = (first + n) % self.capacity
+            ts += time.ticks_diff(self.times[i], previous)
+            previous = self.times[i]
+            span = self.spans[i]
+            events.append({
+                "name": self.names[span],
+                "ph": "B" if self.phases[i] == BEGIN else "E",
+                "ts": ts,
+                "pid": 1,
+                "tid": self.threads[span]
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+# Shared by every module
+tracer = Tracer()
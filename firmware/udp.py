@@ -0,0 +1,157 @@
+import socket
+from struct import unpack_from
+from sys import platform
+from log import log
+
+if platform == "esp32":
+  import _thread as thread
+else:
+  thread = None
+
+try:
+  import uasyncio as asyncio
+except ImportError:
+  try:
+    import asyncio
+  except ImportError:
+    asyncio = None
+
+# Datagram layout, little endian :
+# header : magic (2 bytes, "LM") | version (uint8)
+# then any number of sections : command (uint8) | panel (uint8) | groups (uint8) | length (uint16) | payload
+MAGIC = b"LM"
+VERSION = 1
+HEADER_SIZE = 3
+SECTION_FORMAT = "<BBBH"
+SECTION_SIZE = 5
+
+# Section addressed to every panel
+ALL_PANELS = 0xFF
+
+# Commands
+ADDEVENT = 1  # payload : packed event records, see event_queue.RECORD_FORMAT
+DELALL = 2  # no payload
+WANDERING = 3  # payload : "<4L2B" min_ms, max_ms, idle_min_ms, idle_max_ms, min_c, max_c
+CALIBRATE = 4  # payload : "<q" current_time
+
+
+class UDPServer:
+  def __init__(self, port=4210, group="239.76.77.1", panel=None, groups=0):
+    """
+    UDP control channel. A single datagram can reach every panel at once,
+    sections inside the datagram are addressed per panel or per group.
+    Decorates commands functions as @obj_name.command(code)
+    :port: Int | listening port
+    :group: Str | multicast group to join, None to only receive unicast and broadcast
+    :panel: Int | this panel id (0-254), None if the panel only answers to groups and ALL_PANELS
+    :groups: Int | bitmask of groups this panel belongs to
+    """
+    self.commands_register = {}
+    self.port = port
+    self.group = group
+    self.panel = panel
+    self.groups = groups
+    self.socket = None
+    self.debug = True
+
+  def command(self, code):
+    """
+    Used as a decorator to register commands. Commands receive the section payload as a memoryview.
+    """
+
+    def func_wrapper(func):
+      self.commands_register[code] = func
+      return func
+
+    return func_wrapper
+
+  def addressed(self, panel, groups):
+    """
+    Checks if a section is addressed to this panel
+    :panel: Int | section panel id
+    :groups: Int | section groups bitmask, 0 for no group
+    :return: Boolean
+    """
+    if panel == ALL_PANELS:
+      return not groups or bool(groups & self.groups)
+    return panel == self.panel
+
+  def handle(self, datagram):
+    """
+    Executes every section of a datagram addressed to this panel
+    :datagram: bytes
+    :return: Int | number of executed sections
+    """
+    if len(datagram) < HEADER_SIZE or datagram[0:2] != MAGIC or datagram[2] != VERSION:
+      return 0
+
+    view = memoryview(datagram)
+    executed = 0
+    offset = HEADER_SIZE
+    while offset + SECTION_SIZE <= len(datagram):
+      command, panel, groups, length = unpack_from(SECTION_FORMAT, datagram, offset)
+      offset += SECTION_SIZE
+      payload = view[offset:offset + length]
+      offset += length
+      if not self.addressed(panel, groups) or command not in self.commands_register:
+        continue
+      try:
+        self.commands_register[command](payload)
+        executed += 1
+      except Exception as err:
+        log.error("[UDPServer] Command {} failed : {}", command, err)
+    return executed
+
+  def open(self):
+    """
+    Binds the socket and joins the multicast group
+    """
+    self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.socket.bind(('0.0.0.0', self.port))
+    if self.group:
+      # ip_mreq : group address then local interface (any)
+      mreq = bytes([int(b) for b in self.group.split(".")]) + bytes(4)
+      self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+
+  def run(self, debug=True, threaded=True):
+    """
+    Blocking receive loop
+    :debug: Boolean | Log the datagrams
+    :threaded: Boolean | Run the loop in a new thread when available
+    """
+    if threaded:
+      if thread:
+        thread.start_new_thread(self.run, (debug, False))
+        return
+
+    self.debug = debug
+    self.open()
+    while True:
+      datagram, addr = self.socket.recvfrom(1500)
+      executed = self.handle(datagram)
+      if debug:
+        log.info("[UDPServer] {} section(s) executed from {}", executed, addr)
+
+  async def serve(self, debug=True):
+    """
+    Receive loop as a (u)asyncio task
+    :debug: Boolean | Log the datagrams
+    """
+    self.debug = debug
+    self.open()
+    self.socket.setblocking(False)
+    if hasattr(asyncio, "get_running_loop"):
+      # CPython asyncio
+      loop = asyncio.get_running_loop()
+      recv = lambda: loop.sock_recv(self.socket, 1500)
+    else:
+      # uasyncio polls the socket through a stream
+      stream = asyncio.StreamReader(self.socket)
+      recv = lambda: stream.read(1500)
+
+    while True:
+      datagram = await recv()
+      executed = self.handle(datagram)
+      if debug:
+        log.info("[UDPServer] {} section(s) executed", executed)
@@ -1,5 +1,11 @@
 import time
 import urandom
+from easing import ease, progress, NAMES, SCALE
+from tracing import tracer
+
+REFRESH_SPAN = tracer.span("wanderer refresh")
+
+EASING = NAMES["easeInOutQuad"]
 
 class WanderingCoefficient:
     def __init__(self, min_ms, max_ms, idle_min_ms, idle_max_ms, min_c, max_c=100):
@@ -31,10 +37,33 @@ class WanderingCoefficient:
         self._current_time_target = self.generate_time_target()
         self._current_coef_target = self.generate_coef_target()
 
+    def configure(self, min_ms, max_ms, idle_min_ms, idle_max_ms, min_c, max_c):
+        """
+        Validates and sets every wandering parameter at once
+        Raises ValueError if durations are negatives or coefficients out of 0-100
+        """
+        # Checking that time arent negatives
+        if any(value < 0 for value in [min_ms, max_ms, idle_min_ms, idle_max_ms]):
+            raise ValueError("Negative duration")
+
+        # Checking that coefficient is beetween 0 and 100
+        if any(value < 0 or value > 100 for value in [min_c, max_c]):
+            raise ValueError("Coefficient out of range")
+
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+
+        self.idle_min_ms = idle_min_ms
+        self.idle_max_ms = idle_max_ms
+
+        self.min_c = min_c
+        self.max_c = max_c
+
     def refresh_targets(self):
         """
         Toggle wandering state (idle/slope) and generate new coefs/times
         """
+        tracer.begin(REFRESH_SPAN)
         # Storing previous values for easing purpose
         self._previous_time_target = self._current_time_target
         self._previous_coef_target = self._current_coef_target
@@ -48,6 +77,7 @@ class WanderingCoefficient:
             # Generating new idle time
             self._current_time_target = self.generate_idle_time()
             self.idle = True
+        tracer.end(REFRESH_SPAN)
 
     def generate_idle_time(self):
         """
@@ -71,11 +101,20 @@ class WanderingCoefficient:
     def coefficient(self):
         """
         Return a coefficient and ensure that the targets gets updated when required
+        :return: Int | fixed point coefficient, easing.SCALE being 100%
         """
         if self.target_expired:
             self.refresh_targets()
-        return self._previous_coef_target + (
-                    self._current_coef_target - self._previous_coef_target) * self.easeInOutQuad(self.completion)
+        return (self._previous_coef_target * SCALE + (
+                    self._current_coef_target - self._previous_coef_target) * ease(EASING, self.completion)) // 100
+
+    def next_change(self):
+        """
+        Return the numbers of MS before the coefficient changes, 0 while sloping
+        """
+        if self.idle or self._previous_coef_target == self._current_coef_target:
+            return max(0, self.expires_in)
+        return 0
 
     @property
     def target_expired(self):
@@ -98,17 +137,11 @@ class WanderingCoefficient:
     @property
     def completion(self):
         """
-        Return the completion rate of the current target
+        Return the completion rate of the current target, easing.PROGRESS being 1
         """
         duration = self._current_time_target - self._previous_time_target
         current_time = time.ticks_ms() - self._previous_time_target
-        return current_time / duration
-
-    def easeInOutQuad(self, t):
-        """
-        Mathematical function to get a smooth slope
-        """
-        return 2 * t * t if t < 0.5 else -1 + (4 - 2 * t) * t
+        return progress(current_time, duration)
 
     @staticmethod
     def randint(min_v, max_v):
@@ -0,0 +1,77 @@
+"""
+Host simulator : runs the firmware on CPython.
+MicroPython-only modules (machine, network, urandom, esp, micropython, uasyncio)
+are replaced by the stand-ins of host/shims, and time.ticks_* follow a VirtualClock.
+
+    import host
+    clock = host.install()
+    from lightmix import LightMix
+"""
+import gc
+import os
+import sys
+import time
+import traceback
+import tracemalloc
+
+from host.virtual_time import VirtualClock, TICKS_PERIOD
+from host.memory_socket import MemorySocket
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRMWARE = os.path.join(ROOT, "firmware")
+SHIMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shims")
+
+# ESP32 heap available to MicroPython, in bytes
+HEAP_SIZE = 111168
+
+# Clock in use, set by install
+clock = None
+
+
+def _print_exception(exception, file=sys.stdout):
+    traceback.print_exception(type(exception), exception, exception.__traceback__, file=file)
+
+
+def install(realtime=False, start_us=0, trace_memory=False, heap=HEAP_SIZE):
+    """
+    Makes the firmware importable and sets up the MicroPython stand-ins.
+    Calling it again replaces the clock.
+
+    :realtime: Boolean | ticks follow the host clock instead of a virtual one
+    :start_us: Int | initial clock time, in microseconds
+    :trace_memory: Boolean | report Python allocations (tracemalloc) through gc.mem_alloc.
+      Slows everything down, keep it off for benchmarks
+    :heap: Int | heap size reported through gc.mem_free
+    :return: VirtualClock
+    """
+    global clock
+    clock = VirtualClock(realtime, start_us)
+    for path in (FIRMWARE, SHIMS):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    time.ticks_ms = clock.ticks_ms
+    time.ticks_us = clock.ticks_us
+    time.ticks_cpu = clock.ticks_cpu
+    time.ticks_diff = clock.ticks_diff
+    time.ticks_add = clock.ticks_add
+    time.sleep_ms = clock.sleep_ms
+    time.sleep_us = clock.sleep_us
+
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _threshold = [-1]
+
+    def mem_alloc():
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+    def threshold(amount=None):
+        if amount is None:
+            return _threshold[0]
+        _threshold[0] = amount
+
+    gc.mem_alloc = mem_alloc
+    gc.mem_free = lambda: max(0, heap - mem_alloc())
+    gc.threshold = threshold
+    sys.print_exception = _print_exception
+    return clock
@@ -0,0 +1,265 @@
+"""
+Micro-benchmarks of the firmware hot paths, on the host simulator.
+
+    python -m host.bench [--label name] [--filter text] [--quick] [--no-save]
+
+Every benchmark reports microseconds per operation (median of several runs).
+Results are appended to host/results.jsonl, and compared with the previous
+entry, so performance changes between versions are visible.
+Host timings are only meaningful relatively : the ESP32 is about two orders of magnitude slower.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from struct import pack
+
+import host
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+
+# Tick period, in milliseconds
+PERIOD = 20
+
+EVENT_STRINGS = (
+    "",
+    "ce=ff&d=1000",
+    "cs=ff0000&ce=ff&d=1000&k=1",
+    "t=1700000005000&cs=ff00ff20&ce=00ff0040&d=250&e=easeOutBounce",
+    "t=1700000010000&ce=12345678&d=40&e=7",
+)
+
+HTTP_REQUEST = (b"GET /addevent?t=1700000005000&cs=ff00ff20&ce=00ff0040&d=250 HTTP/1.1\r\n"
+                b"Host: 192.168.1.42\r\nUser-Agent: python-requests/2.31\r\n"
+                b"Accept: */*\r\nConnection: keep-alive\r\n\r\n")
+
+
+def measure(function, number, repeat=5, setup=None):
+    """
+    :function: Callable | runs `number` operations
+    :setup: Callable | run before each run, not timed
+    :return: Float | median microseconds per operation
+    """
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter_ns()
+        function()
+        runs.append((time.perf_counter_ns() - start) / 1000 / number)
+    runs.sort()
+    return runs[len(runs) // 2]
+
+
+def calibrated_lightmix():
+    from lightmix import LightMix
+    lightmix = LightMix()
+    lightmix.set_time_offset(1700000000000)
+    return lightmix
+
+
+def record(start, duration, cs=(255, 0, 0, 0), ce=(0, 0, 255, 0), flags=0, easing=4):
+    from event_queue import RECORD_FORMAT
+    return pack(RECORD_FORMAT, start, duration, *cs, *ce, flags, easing)
+
+
+def bench_parse(scale):
+    from requests import HTTPRequestParser
+    lightmix = calibrated_lightmix()
+    results = {}
+
+    number = 2000 * scale
+    strings = EVENT_STRINGS * (number // len(EVENT_STRINGS))
+
+    def parse_events():
+        for string in strings:
+            lightmix.event_from_string(string)
+    results["parse.event_from_string"] = measure(parse_events, len(strings))
+
+    def parse_requests():
+        for _ in range(number):
+            HTTPRequestParser(HTTP_REQUEST).params_dict()
+    results["parse.http_request"] = measure(parse_requests, number)
+
+    records = b"".join(record(1700000005000 + i * 20, 20) for i in range(200))
+
+    def parse_records():
+        for _ in range(scale):
+            lightmix.clear()
+            lightmix.add_packed_events(records)
+    results["parse.packed_record"] = measure(parse_records, 200 * scale)
+    return results
+
+
+def bench_tick(scale):
+    results = {}
+    ticks = 1000 * scale
+
+    for depth in (0, 16, 128, 511):
+        lightmix = calibrated_lightmix()
+        now = lightmix.clock.now()
+        # A running event, long enough to last the whole run, plus depth events far ahead
+        lightmix.add_event("t={}&cs=ff&ce=ff000000&d={}".format(now, 10 * ticks * PERIOD))
+        for i in range(depth):
+            lightmix.add_event("t={}&ce=ff&d=100".format(now + 100000000 + i))
+        lightmix.update()
+
+        def run():
+            for _ in range(ticks):
+                host.clock.advance(PERIOD)
+                lightmix.update()
+        results["tick.update.depth_{}".format(depth)] = measure(run, ticks)
+
+    # Every tick ends an event and starts the next one
+    lightmix = calibrated_lightmix()
+
+    def fill():
+        lightmix.clear()
+        now = lightmix.clock.now()
+        lightmix.add_packed_events(b"".join(
+            record(now + i * PERIOD, PERIOD, ce=(i & 255, 0, 0, 0)) for i in range(ticks // 2)))
+
+    def turnover():
+        for _ in range(ticks // 2):
+            host.clock.advance(PERIOD)
+            lightmix.update()
+    results["tick.update.turnover"] = measure(turnover, ticks // 2, setup=fill)
+
+    # Full queue : every tick pops the next event and a new one is queued at the back
+    depth = lightmix.queue.capacity - 1
+
+    def fill_deep():
+        lightmix.clear()
+        now = lightmix.clock.now()
+        lightmix.add_packed_events(b"".join(record(now + i * PERIOD, PERIOD) for i in range(depth)))
+
+    def deep_turnover():
+        for _ in range(ticks // 2):
+            host.clock.advance(PERIOD)
+            lightmix.update()
+            lightmix.add_packed_events(record(lightmix.clock.now() + depth * PERIOD, PERIOD))
+    results["tick.update.turnover_depth_{}".format(depth)] = measure(deep_turnover, ticks // 2, setup=fill_deep)
+    return results
+
+
+def bench_requests(scale):
+    """
+    Full request handling, as the blocking server does : parsing, body, route and response
+    """
+    import main
+    server = main.server
+    main.lightmix.set_time_offset(1700000000000)
+    results = {}
+    number = 500 * scale
+
+    def handle(raw):
+        client = host.MemorySocket(raw)
+        server.handle(client)
+        return client
+
+    body = b"".join(record(1700000005000 + i * 20, 20) for i in range(100))
+    requests = {
+        "request.addevent": HTTP_REQUEST,
+        "request.addevent_batch": b"GET /addevent?" + b"&&".join(
+            s.encode() for s in EVENT_STRINGS[1:]) + b" HTTP/1.1\r\n\r\n",
+        "request.addevents": b"POST /addevents HTTP/1.1\r\nContent-Length: " +
+                             str(len(body)).encode() + b"\r\n\r\n" + body,
+        "request.calibrate": b"GET /calibrate?current_time=1700000000000 HTTP/1.1\r\n\r\n",
+        "request.stats": b"GET /stats HTTP/1.1\r\n\r\n",
+        "request.not_found": b"GET /missing HTTP/1.1\r\n\r\n",
+    }
+    for name, raw in requests.items():
+        assert handle(raw).sent.startswith(b"HTTP/1.1 "), name
+
+        def run():
+            for _ in range(number):
+                handle(raw)
+                # Keeping the queue from filling up
+                if len(main.lightmix.queue) > 400:
+                    main.lightmix.clear()
+        results[name] = measure(run, number)
+    return results
+
+
+BENCHMARKS = (bench_parse, bench_tick, bench_requests)
+
+
+def version():
+    """
+    :return: Str | current commit, with a + when the tree has changes
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=host.ROOT,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--", "firmware"], cwd=host.ROOT,
+                                        stderr=subprocess.DEVNULL).strip()
+        return commit + ("+" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_results():
+    """
+    :return: Dict | last stored entry, None if there is none
+    """
+    if not os.path.exists(RESULTS):
+        return None
+    last = None
+    with open(RESULTS) as file:
+        for line in file:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+
+def report(results, previous):
+    stored = previous["results"] if previous else {}
+    if previous:
+        print("Compared with {} ({})".format(previous["label"], previous["date"]))
+    print("{:<32}{:>12}{:>12}{:>10}".format("benchmark", "us/op", "previous", "change"))
+    for name, value in results.items():
+        before = stored.get(name)
+        change = "{:+.1f}%".format((value - before) / before * 100) if before else ""
+        print("{:<32}{:>12.2f}{:>12}{:>10}".format(
+            name, value, "{:.2f}".format(before) if before else "", change))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Firmware micro-benchmarks")
+    parser.add_argument("--label", help="name of this run, the current commit by default")
+    parser.add_argument("--filter", default="", help="only run benchmarks containing this text")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, for smoke tests")
+    parser.add_argument("--no-save", action="store_true", help="don't store the results")
+    arguments = parser.parse_args(arguments)
+
+    host.install()
+    from log import log
+    # Logs are drained between ticks on the device, not here
+    log.level = 100
+
+    scale = 1 if arguments.quick else 5
+    results = {}
+    for benchmark in BENCHMARKS:
+        for name, value in benchmark(scale).items():
+            if arguments.filter in name:
+                results[name] = round(value, 3)
+
+    report(results, previous_results())
+    if not arguments.no_save:
+        entry = {
+            "label": arguments.label or version(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": "{} {}".format(platform.python_implementation(), platform.python_version()),
+            "results": results
+        }
+        with open(RESULTS, "a") as file:
+            file.write(json.dumps(entry) + "\n")
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
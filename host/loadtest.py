@@ -0,0 +1,517 @@
+"""
+Load generator and soak test : runs main.py (tick loop, WebServer) on the host,
+fires a request stream at it, and measures what viewers would see.
+
+    python -m host.loadtest [--duration 60] [--rate 50] [--batch 1] [--concurrency 4] ...
+
+The stream is either a synthetic show (a chain of /addevent events sent ahead of time,
+plus periodic /calibrate) or a replayed file (--replay). A generated stream can be saved
+with --record, then replayed to compare versions on the exact same traffic.
+
+Replay files hold one JSON request per line :
+    {"at": 1500, "method": "GET", "path": "/addevent?t=2500&ce=ff&d=100"}
+    {"at": 1520, "method": "POST", "path": "/addevents", "body": "<hex>"}
+"at" is in milliseconds from the start of the stream. In paths, "{now}" is replaced by the
+backend time when sending, and t values below 10^11 are taken relative to the stream start
+(as are packed record starts).
+
+Reported :
+- frames : ticks, dropped (skipped) frames, overruns, lateness and tick duration histograms
+- requests : count, errors and latency percentiles
+- output : deviation of the output colour from the ideal curve, when written and when replaced
+- memory (--memory) : firmware allocations over time, and their growth rate
+"""
+import argparse
+import asyncio
+import gc
+import json
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from random import Random
+from struct import unpack_from
+
+import host
+
+# t parameters below this are relative to the stream start
+RELATIVE_LIMIT = 10 ** 11
+
+
+def backend_time():
+    """
+    Backend clock, in unix milliseconds
+    """
+    return int(time.time() * 1000)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def synthetic_stream(duration, rate, batch, lead, calibrate_every, seed):
+    """
+    A show made of consecutive events, each request carrying `batch` of them.
+    Events last 1000 / (rate * batch) ms, so the show is continuous.
+    :return: List of request dicts, in replay format
+    """
+    random = Random(seed)
+    event_ms = max(1, 1000 // (rate * batch))
+    requests = []
+    start = lead
+    count = int(duration * rate)
+    for n in range(count):
+        events = []
+        for _ in range(batch):
+            events.append("t={}&cs={:08x}&ce={:08x}&d={}&e={}".format(
+                start, random.getrandbits(32), random.getrandbits(32), event_ms, random.randrange(32)))
+            start += event_ms
+        at = n * 1000 // rate
+        requests.append({"at": at, "method": "GET", "path": "/addevent?" + "&&".join(events)})
+    if calibrate_every:
+        for at in range(calibrate_every, int(duration * 1000), calibrate_every):
+            requests.append({"at": at, "method": "GET", "path": "/calibrate?current_time={now}"})
+    requests.sort(key=lambda r: r["at"])
+    return requests
+
+
+def absolute(request, base):
+    """
+    Moves relative times of a request after base
+    :return: Tuple (method, path, body)
+    """
+    from event_queue import RECORD_FORMAT, RECORD_SIZE
+
+    def shift(match):
+        value = int(match.group(2))
+        return match.group(1) + str(value + base if value < RELATIVE_LIMIT else value)
+
+    path = re.sub(r"([?&]t=)(\d+)", shift, request["path"])
+    body = bytes.fromhex(request.get("body", ""))
+    if body and path.startswith("/addevents"):
+        body = bytearray(body)
+        for offset in range(0, len(body) - RECORD_SIZE + 1, RECORD_SIZE):
+            start = unpack_from("<q", body, offset)[0]
+            if start < RELATIVE_LIMIT:
+                body[offset:offset + 8] = (start + base).to_bytes(8, "little", signed=True)
+        body = bytes(body)
+    return request["method"], path, body
+
+
+class Schedule:
+    def __init__(self, requests, lightmix):
+        """
+        Ideal output of a request stream : timed events, played one after another.
+        Events without start time (played on receipt) can't be predicted and are ignored.
+        :requests: List of Tuple (method, path, body) | absolute requests
+        :lightmix: LightMix | used to parse events as the firmware does
+        """
+        from easing import CURVES
+        from event_queue import FLAG_NOW, FLAG_KEEP_START, FLAG_KEEP_TARGET, RECORD_FORMAT, RECORD_SIZE
+        from event import UNSET
+        self.curves = [curve for name, curve in CURVES]
+
+        events = []
+        for method, path, body in requests:
+            if path.startswith("/addevent?"):
+                for parameters in path.split("?", 1)[1].split("&&"):
+                    start, duration, cs, ce, flags, easing = lightmix.event_from_string(parameters)
+                    if not flags & FLAG_NOW:
+                        events.append((start, duration, list(cs), list(ce), easing))
+            elif path.startswith("/addevents"):
+                convert = lightmix.convert_to_10_bit
+                for offset in range(0, len(body) - RECORD_SIZE + 1, RECORD_SIZE):
+                    record = unpack_from(RECORD_FORMAT, body, offset)
+                    flags = record[10]
+                    if flags & FLAG_NOW:
+                        continue
+                    cs = [UNSET] * 4 if flags & FLAG_KEEP_START else [convert(v) for v in record[2:6]]
+                    ce = [UNSET] * 4 if flags & FLAG_KEEP_TARGET else [convert(v) for v in record[6:10]]
+                    events.append((record[0], max(1, record[1]), cs, ce, record[11]))
+        # Stable : identical starts are played in arrival order
+        events.sort(key=lambda e: e[0])
+
+        # Unset channels take the color reached by the previous event
+        current = [0, 0, 0, 0]
+        for start, duration, cs, ce, easing in events:
+            for c in range(4):
+                if cs[c] == UNSET:
+                    cs[c] = current[c]
+                if ce[c] == UNSET:
+                    ce[c] = current[c]
+            current = ce
+        self.events = events
+        self.index = -1
+        self.end = events[-1][0] + events[-1][1] if events else 0
+
+    def ideal(self, t):
+        """
+        Ideal RGBW values at a time. Cheap when times mostly increase between calls.
+        :t: Int | backend time, in milliseconds
+        """
+        events = self.events
+        while self.index >= 0 and events[self.index][0] > t:
+            self.index -= 1
+        while self.index + 1 < len(events) and events[self.index + 1][0] <= t:
+            self.index += 1
+        if self.index < 0:
+            return (0, 0, 0, 0)
+        start, duration, cs, ce, easing = events[self.index]
+        if t >= start + duration:
+            return ce
+        coefficient = self.curves[easing]((t - start) / duration)
+        # Overshooting curves are clipped by the PWM output
+        return [min(1023, max(0, cs[c] + (ce[c] - cs[c]) * coefficient)) for c in range(4)]
+
+
+class Deviations:
+    def __init__(self):
+        """
+        Frames counted by deviation from the ideal output (max over channels, 10 bits units)
+        """
+        self.counts = [0] * 1025
+        self.frames = 0
+
+    def add(self, values, ideal):
+        deviation = int(max(abs(values[c] - ideal[c]) for c in range(4)) + 0.5)
+        self.counts[min(deviation, 1024)] += 1
+        self.frames += 1
+
+    def report(self, tolerance):
+        frames = self.frames
+        total = 0
+        over = 0
+        p50 = p99 = maximum = 0
+        seen = 0
+        for deviation, count in enumerate(self.counts):
+            if not count:
+                continue
+            total += deviation * count
+            if deviation > tolerance:
+                over += count
+            if seen < frames * 0.5 <= seen + count:
+                p50 = deviation
+            if seen < frames * 0.99 <= seen + count:
+                p99 = deviation
+            seen += count
+            maximum = deviation
+        return {
+            "frames": frames,
+            "mean": round(total / frames, 2) if frames else 0,
+            "p50": p50,
+            "p99": p99,
+            "max": maximum,
+            "over_tolerance": over
+        }
+
+
+class OutputMonitor:
+    def __init__(self, lightmix):
+        """
+        Compares the output with the ideal curve, around every tick :
+        - held : output about to be replaced, against the ideal at that (backend) time.
+          What viewers saw at the end of each frame : grows with late and dropped frames,
+          and with synchronisation errors
+        - fresh : output written by the tick, against the ideal at the panel time of the tick.
+          Shows computing errors only
+        The clock error (panel time minus backend time) is sampled on every tick.
+        """
+        self.lightmix = lightmix
+        self.schedule = None
+        self.fresh = Deviations()
+        self.held = Deviations()
+        self.clock_errors = []
+        self.active = False
+
+    def before(self):
+        if self.active:
+            now = backend_time()
+            self.clock_errors.append(self.lightmix.clock.now() - now)
+            if now <= self.schedule.end:
+                self.held.add(self.lightmix.values, self.schedule.ideal(now))
+
+    def after(self):
+        if self.active:
+            clock = self.lightmix.clock
+            # Local time of the tick, as set by ClockSync.advance
+            panel_time = clock.now(clock._base[1])
+            if panel_time <= self.schedule.end:
+                self.fresh.add(self.lightmix.values, self.schedule.ideal(panel_time))
+
+    def report(self, tolerance):
+        errors = [abs(error) for error in self.clock_errors]
+        return {
+            "tolerance": tolerance,
+            "held": self.held.report(tolerance),
+            "fresh": self.fresh.report(tolerance),
+            "clock_error_ms": {
+                "p50": percentile(errors, 0.5),
+                "p99": percentile(errors, 0.99),
+                "max": max(errors or [0])
+            }
+        }
+
+
+class Client:
+    def __init__(self, address, port):
+        """
+        Persistent HTTP connection, reopened when the server closes it
+        """
+        self.address = address
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=b""):
+        """
+        :return: Int | response status
+        """
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.address, self.port)
+        head = "{} {} HTTP/1.1\r\nHost: {}\r\n".format(method, path, self.address)
+        if body:
+            head += "Content-Length: {}\r\n".format(len(body))
+        self.writer.write(head.encode() + b"\r\n" + body)
+        try:
+            await self.writer.drain()
+            response = await self.reader.readuntil(b"\r\n\r\n")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            raise
+        lines = response.decode().split("\r\n")
+        status = int(lines[0].split()[1])
+        length = 0
+        close = False
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection":
+                close = value.strip().lower() == "close"
+        await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+
+
+class LoadTest:
+    def __init__(self, arguments):
+        self.arguments = arguments
+        self.latencies = []
+        self.errors = 0
+        self.sent = 0
+        self.memory = []  # (seconds, bytes) firmware allocations
+
+    def start_firmware(self):
+        """
+        Runs main.py on its own event loop, in a background thread
+        """
+        import main
+        self.main = main
+        main.server.port = self.arguments.port
+        main.server.debug = False
+        main.udp_server.port = 0
+        main.udp_server.group = None
+
+        # Sampling the output after every tick
+        tick = main.scheduler.callback
+
+        def sampled():
+            self.monitor.before()
+            next_change = tick()
+            self.monitor.after()
+            return next_change
+        main.scheduler.callback = sampled
+
+        thread = threading.Thread(target=lambda: asyncio.run(main.run_async()), daemon=True)
+        thread.start()
+
+    async def wait_server(self):
+        for _ in range(100):
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", self.arguments.port)
+                writer.close()
+                return
+            except OSError:
+                await asyncio.sleep(0.05)
+        raise RuntimeError("Firmware server didn't start")
+
+    def firmware_memory(self):
+        """
+        Live allocations made by firmware code, in bytes
+        """
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, host.FIRMWARE + "/*")])
+        return sum(stat.size for stat in snapshot.statistics("filename"))
+
+    async def worker(self, queue, client):
+        while True:
+            method, path, body = await queue.get()
+            path = path.replace("{now}", str(backend_time()))
+            start = time.perf_counter()
+            try:
+                status = await client.request(method, path, body)
+                if not 200 <= status < 300:
+                    self.errors += 1
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                self.errors += 1
+            self.latencies.append((time.perf_counter() - start) * 1000)
+            self.sent += 1
+            queue.task_done()
+
+    async def run(self):
+        arguments = self.arguments
+        main = self.main
+        lightmix = main.lightmix
+        await self.wait_server()
+
+        # Initial calibration, then the stream starts
+        client = Client("127.0.0.1", arguments.port)
+        await client.request("GET", "/calibrate?current_time={}".format(backend_time()))
+        client.close()
+        base = backend_time() + 200
+
+        if arguments.replay:
+            with open(arguments.replay) as file:
+                stream = [json.loads(line) for line in file if line.strip()]
+        else:
+            stream = synthetic_stream(arguments.duration, arguments.rate, arguments.batch, arguments.lead,
+                                      arguments.calibrate_every, arguments.seed)
+        if arguments.record:
+            with open(arguments.record, "w") as file:
+                for request in stream:
+                    file.write(json.dumps(request) + "\n")
+
+        requests = [absolute(request, base) for request in stream]
+        self.monitor.schedule = Schedule(requests, lightmix)
+
+        scheduler = main.scheduler
+        scheduler.jitter.reset()
+        scheduler.durations.reset()
+        counters = (scheduler.ticks, scheduler.skipped, scheduler.missed, scheduler.idle)
+        self.monitor.active = True
+
+        queue = asyncio.Queue()
+        workers = [asyncio.create_task(self.worker(queue, Client("127.0.0.1", arguments.port)))
+                   for _ in range(arguments.concurrency)]
+        started = time.perf_counter()
+        next_memory = 0
+        for request, (method, path, body) in zip(stream, requests):
+            delay = base + request["at"] - backend_time()
+            if delay > 0:
+                await asyncio.sleep(delay / 1000)
+            queue.put_nowait((method, path, body))
+            if arguments.memory and time.perf_counter() - started >= next_memory:
+                self.memory.append((round(time.perf_counter() - started, 1), self.firmware_memory()))
+                next_memory += arguments.memory_every
+        await queue.join()
+        # Letting the show end
+        remaining = self.monitor.schedule.end - backend_time()
+        if remaining > 0:
+            await asyncio.sleep(remaining / 1000 + 0.1)
+        self.monitor.active = False
+        elapsed = time.perf_counter() - started
+        if arguments.memory:
+            self.memory.append((round(elapsed, 1), self.firmware_memory()))
+        for worker in workers:
+            worker.cancel()
+
+        return {
+            "duration": round(elapsed, 1),
+            "frames": {
+                "periods": int(elapsed * 1000000 / scheduler.period),
+                "ticks": scheduler.ticks - counters[0],
+                "idle": scheduler.idle - counters[3],
+                "dropped": scheduler.skipped - counters[1],
+                "overruns": scheduler.missed - counters[2],
+                "late": scheduler.jitter.as_dict(),
+                "duration": scheduler.durations.as_dict()
+            },
+            "requests": {
+                "sent": self.sent,
+                "errors": self.errors,
+                "rate": round(self.sent / elapsed, 1),
+                "latency_ms": {
+                    "p50": round(percentile(self.latencies, 0.5), 2),
+                    "p99": round(percentile(self.latencies, 0.99), 2),
+                    "max": round(max(self.latencies or [0]), 2)
+                }
+            },
+            "output": self.monitor.report(arguments.tolerance),
+            "memory": self.memory_report()
+        }
+
+    def memory_report(self):
+        if not self.memory:
+            return None
+        first, last = self.memory[0][1], self.memory[-1][1]
+        # Growth rate : least squares over the samples, the first one being taken before warming up
+        samples = self.memory[1:]
+        growth = 0
+        if len(samples) >= 2:
+            mean_t = sum(t for t, _ in samples) / len(samples)
+            mean_size = sum(size for _, size in samples) / len(samples)
+            stt = sum((t - mean_t) ** 2 for t, _ in samples)
+            if stt:
+                growth = sum((t - mean_t) * (size - mean_size) for t, size in samples) / stt * 60
+        return {
+            "samples": self.memory,
+            "start": first,
+            "end": last,
+            "peak": max(size for _, size in self.memory),
+            "growth_per_minute": round(growth)
+        }
+
+    def main_loop(self):
+        import main
+        self.monitor = OutputMonitor(main.lightmix)
+        self.start_firmware()
+        return asyncio.run(self.run())
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Firmware load test and soak test")
+    parser.add_argument("--duration", type=float, default=30, help="synthetic stream length, in seconds")
+    parser.add_argument("--rate", type=int, default=10, help="synthetic requests per second")
+    parser.add_argument("--batch", type=int, default=1, help="events per synthetic request")
+    parser.add_argument("--lead", type=int, default=1000, help="how early events are sent, in milliseconds")
+    parser.add_argument("--calibrate-every", type=int, default=5000,
+                        help="milliseconds between /calibrate requests, 0 for none")
+    parser.add_argument("--concurrency", type=int, default=4, help="persistent connections")
+    parser.add_argument("--replay", help="replay a recorded stream instead")
+    parser.add_argument("--record", help="save the stream, to replay it later")
+    parser.add_argument("--seed", type=int, default=1, help="synthetic stream random seed")
+    parser.add_argument("--port", type=int, default=8080, help="firmware HTTP port")
+    parser.add_argument("--tolerance", type=int, default=16,
+                        help="output deviation counted as visible, in 10 bits units")
+    parser.add_argument("--memory", action="store_true", help="track firmware allocations (slower)")
+    parser.add_argument("--memory-every", type=float, default=5, help="seconds between memory samples")
+    parser.add_argument("--json", help="also write the report to this file")
+    arguments = parser.parse_args(arguments)
+
+    host.install(realtime=True, trace_memory=arguments.memory)
+    from log import log
+    log.level = 30
+
+    result = LoadTest(arguments).main_loop()
+    report = json.dumps(result, indent=2)
+    print(report)
+    if arguments.json:
+        with open(arguments.json, "w") as file:
+            file.write(report)
+    return result
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,56 @@
+class MemorySocket:
+    def __init__(self, data=b"", chunk=1024):
+        """
+        In-memory connected socket : reads come from data, writes are kept in sent
+        :data: bytes | bytes received by the server, in order
+        :chunk: Int | maximum bytes returned by a single read, as a network would split them
+        """
+        self.data = bytes(data)
+        self.chunk = chunk
+        self.position = 0
+        self.sent = bytearray()
+        self.closed = False
+
+    def feed(self, data):
+        """
+        Appends received bytes
+        """
+        self.data = self.data[self.position:] + bytes(data)
+        self.position = 0
+
+    def recv(self, size):
+        size = min(size, self.chunk)
+        data = self.data[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+    def recv_into(self, buffer, size=0):
+        size = min(size or len(buffer), self.chunk, len(self.data) - self.position)
+        buffer[:size] = self.data[self.position:self.position + size]
+        self.position += size
+        return size
+
+    readinto = recv_into
+
+    def read(self, size=-1):
+        return self.recv(size if size >= 0 else len(self.data))
+
+    def send(self, data):
+        self.sent += data
+        return len(data)
+
+    def sendall(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.sent += data
+
+    write = sendall
+
+    def setblocking(self, flag):
+        pass
+
+    def settimeout(self, value):
+        pass
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,7 @@
+"""
+Host stand-in for the MicroPython esp module
+"""
+
+
+def osdebug(level):
+    pass
@@ -0,0 +1,89 @@
+"""
+Host stand-in for the MicroPython machine module
+"""
+import time
+
+
+class Pin:
+    OUT = 1
+    IN = 0
+
+    def __init__(self, id, mode=-1, *args, **kwargs):
+        self.id = id
+        self.mode = mode
+        self._value = 0
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = value
+
+
+class PWM:
+    # Every PWM created, in creation order
+    instances = []
+    # Keep (ticks_us, duty) of every write in PWM.history when True
+    record = False
+
+    def __init__(self, pin, freq=0, duty=0):
+        """
+        PWM duty recorder
+        """
+        self.pin = pin
+        self._freq = freq
+        self._duty = duty
+        self.writes = 0
+        self.history = []
+        PWM.instances.append(self)
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+        self.writes += 1
+        if PWM.record:
+            self.history.append((time.ticks_us(), value))
+
+    def deinit(self):
+        pass
+
+
+class Timer:
+    PERIODIC = 1
+    ONE_SHOT = 0
+
+    def __init__(self, id):
+        """
+        Timer stand-in. Never fires on its own : call fire() to run the callback
+        """
+        self.id = id
+        self.callback = None
+
+    def init(self, period=0, mode=PERIODIC, callback=None, **kwargs):
+        self.period = period
+        self.mode = mode
+        self.callback = callback
+
+    def fire(self):
+        if self.callback:
+            self.callback(self)
+
+    def deinit(self):
+        self.callback = None
+
+
+def freq(value=None):
+    return 240000000
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+def unique_id():
+    return b"\x24\x0a\xc4\x00\x00\x01"
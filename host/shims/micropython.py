@@ -0,0 +1,19 @@
+"""
+Host stand-in for the micropython module. Scheduled functions run right away
+"""
+
+
+def const(value):
+    return value
+
+
+def schedule(function, argument):
+    function(argument)
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def mem_info(verbose=False):
+    pass
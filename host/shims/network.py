@@ -0,0 +1,35 @@
+"""
+Host stand-in for the MicroPython network module. Interfaces are always connected
+"""
+STA_IF = 0
+AP_IF = 1
+AUTH_WPA_WPA2_PSK = 4
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._active = False
+        self._config = {"mac": b"\x24\x0a\xc4\x00\x00\x01", "essid": "host"}
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = value
+
+    def connect(self, ssid=None, password=None):
+        self._active = True
+
+    def disconnect(self):
+        pass
+
+    def isconnected(self):
+        return True
+
+    def ifconfig(self):
+        return ("127.0.0.1", "255.0.0.0", "127.0.0.1", "127.0.0.1")
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config[args[0]]
+        self._config.update(kwargs)
@@ -0,0 +1,8 @@
+"""
+Host stand-in for uasyncio, on top of asyncio
+"""
+from asyncio import *
+
+
+def sleep_ms(ms):
+    return sleep(ms / 1000)
@@ -0,0 +1,4 @@
+"""
+Host stand-in for the MicroPython urandom module
+"""
+from random import getrandbits, randint, random, seed, choice, uniform
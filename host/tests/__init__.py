@@ -0,0 +1,2 @@
+# Client time the tests calibrate to, in milliseconds
+T0 = 1700000000000
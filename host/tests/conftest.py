@@ -0,0 +1,29 @@
+"""
+Firmware regression tests, on the host simulator.
+
+    python -m pytest host/tests
+"""
+import pytest
+
+import host
+
+host.install()
+
+from log import log  # noqa: E402
+from host.tests import T0  # noqa: E402
+
+# Logs are drained between ticks on the device, not here
+log.level = 100
+
+
+@pytest.fixture
+def clock():
+    return host.clock
+
+
+@pytest.fixture
+def lightmix():
+    from lightmix import LightMix
+    lightmix = LightMix()
+    lightmix.set_time_offset(T0)
+    return lightmix
@@ -0,0 +1,56 @@
+from clock import ClockSync, MAX_SKEW
+
+OFFSET = 1700000000000
+
+
+def test_best_sample_sets_offset():
+    clock = ClockSync()
+    clock.add_sample(1000, OFFSET + 30, 40)
+    clock.add_sample(2000, OFFSET, 2)
+    clock.add_sample(3000, OFFSET - 20, 30)
+    assert clock.offset == OFFSET
+    assert clock.delay == 2
+    assert clock.ref == 2000
+
+
+def test_skew_estimate():
+    clock = ClockSync()
+    # Local clock 100 ppm slow : the offset grows 1 ms every 10 seconds
+    for n in range(6):
+        local = n * 10000
+        clock.add_sample(local, OFFSET + local // 10000, 4)
+    assert abs(clock.skew - 100000) < 1000
+    assert clock.now(50000) == 50000 + OFFSET + 5
+
+
+def test_skew_ignores_slow_samples():
+    clock = ClockSync()
+    for n in range(5):
+        local = n * 10000
+        clock.add_sample(local, OFFSET + local // 10000, 4)
+    # Queued behind a busy network : offset off by the extra delay
+    clock.add_sample(55000, OFFSET + 200, 400)
+    assert abs(clock.skew - 100000) < 1000
+
+
+def test_skew_needs_span():
+    clock = ClockSync(min_span=10000)
+    for n in range(5):
+        clock.add_sample(n * 1000, OFFSET + n, 4)
+    assert clock.skew == 0
+
+
+def test_skew_is_bounded():
+    clock = ClockSync()
+    for n in range(4):
+        clock.add_sample(n * 10000, OFFSET + n * 1000, 4)
+    assert clock.skew == MAX_SKEW
+
+
+def test_negative_delay_rejected():
+    clock = ClockSync()
+    try:
+        clock.add_sample(0, OFFSET, -1)
+    except ValueError:
+        return
+    assert False, "negative delay accepted"
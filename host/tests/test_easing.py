@@ -0,0 +1,40 @@
+import pytest
+
+from easing import CURVES, NAMES, PROGRESS, SCALE, SEGMENTS, curve_id, ease, progress
+
+
+@pytest.mark.parametrize("curve", range(len(CURVES)))
+def test_curve_ends(curve):
+    assert ease(curve, 0) == 0
+    assert ease(curve, PROGRESS) == SCALE
+    # Out of range completions are clamped to the ends of the curve
+    assert ease(curve, -1) == 0
+    assert ease(curve, PROGRESS + 1) == SCALE
+
+
+@pytest.mark.parametrize("curve", range(len(CURVES)))
+def test_interpolation_follows_curve(curve):
+    function = CURVES[curve][1]
+    # Last segment included : the lookup stays inside the curve samples
+    for p in range(0, PROGRESS, PROGRESS // (4 * SEGMENTS) - 1):
+        expected = function(p / PROGRESS) * SCALE
+        tolerance = SCALE if CURVES[curve][0] == "step" else SCALE // 20
+        assert abs(ease(curve, p) - expected) <= tolerance, p
+
+
+def test_progress_bounds():
+    assert progress(-5, 100) == 0
+    assert progress(100, 100) == PROGRESS
+    assert progress(50, 100) == PROGRESS // 2
+    # Long durations are scaled down to stay in small integers, losing some precision
+    assert progress(0x7FFFFFFF // 2, 0x7FFFFFFF) == pytest.approx(PROGRESS // 2, abs=8)
+    assert progress(1, 0x7FFFFFFF) < PROGRESS
+
+
+def test_curve_id_bounds():
+    assert curve_id("linear") == 0
+    assert curve_id(str(len(CURVES) - 1)) == len(CURVES) - 1
+    assert curve_id("easeInOutQuad") == NAMES["easeInOutQuad"]
+    for value in ("-1", str(len(CURVES)), "unknown"):
+        with pytest.raises(ValueError):
+            curve_id(value)
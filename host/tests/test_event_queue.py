@@ -0,0 +1,102 @@
+from event_queue import EventQueue, FLAG_NOW
+
+
+def drain(queue, now=10 ** 9):
+    ids = []
+    while True:
+        event = queue.pop(now)
+        if event is None:
+            return ids
+        ids.append(event.id)
+        queue.release(event)
+
+
+def test_pops_by_start_then_insertion_order():
+    queue = EventQueue(8)
+    late = queue.push(300, 10)
+    first = queue.push(100, 10)
+    second = queue.push(100, 10)
+    middle = queue.push(200, 10)
+    assert queue.next_start() == 100
+    assert [queue.start_at(p) for p in range(4)] == [100, 100, 200, 300]
+    assert drain(queue) == [first, second, middle, late]
+
+
+def test_pop_waits_for_start():
+    queue = EventQueue(4)
+    event_id = queue.push(100, 10)
+    assert queue.pop(99) is None
+    event = queue.pop(100)
+    assert event.id == event_id and event.start == 100 and event.duration == 10
+    assert len(queue) == 0
+
+
+def test_full_queue_rejects():
+    queue = EventQueue(2)
+    assert queue.push(0, 1) and queue.push(0, 1)
+    assert queue.push(0, 1) == 0
+    assert len(queue) == 2
+
+
+def test_cancel_range_boundaries():
+    queue = EventQueue(8)
+    ids = {start: queue.push(start, 10) for start in (99, 100, 150, 199, 200)}
+    # [100, 200[ : the start is included, the end excluded
+    assert queue.cancel_range(100, 200) == 3
+    assert drain(queue) == [ids[99], ids[200]]
+
+
+def test_cancel_range_outside_queue():
+    queue = EventQueue(4)
+    queue.push(100, 10)
+    assert queue.cancel_range(0, 100) == 0
+    assert queue.cancel_range(101, 1000) == 0
+    assert len(queue) == 1
+
+
+def test_last_end_follows_removals():
+    queue = EventQueue(8)
+    assert queue.last_end() is None
+    queue.push(100, 50)
+    longest = queue.push(120, 500)
+    queue.push(200, 10)
+    assert queue.last_end() == 620
+    assert queue.cancel(longest)
+    assert queue.last_end() == 210
+    assert queue.cancel_range(200, 201) == 1
+    assert queue.last_end() == 150
+    drain(queue)
+    assert queue.last_end() is None
+
+
+def test_last_end_after_shift_and_clear():
+    queue = EventQueue(4)
+    queue.push(100, 50)
+    queue.shift(40)
+    assert queue.last_end() == 110
+    assert queue.next_start() == 60
+    queue.clear()
+    assert queue.last_end() is None
+    queue.push(10, 10)
+    assert queue.last_end() == 20
+
+
+def test_last_end_ignores_untimed_events():
+    queue = EventQueue(4)
+    queue.push(100, 50)
+    queue.push(0, 10000, flags=FLAG_NOW)
+    assert queue.last_end() == 150
+
+
+def test_failed_push_keeps_slot():
+    queue = EventQueue(2)
+    for start, duration in ((1 << 70, 10), (0, 1 << 70)):
+        try:
+            queue.push(start, duration)
+        except OverflowError:
+            pass
+    assert len(queue) == 0
+    # Both slots still usable, each once
+    first, second = queue.push(0, 1), queue.push(1, 1)
+    assert first and second and queue.push(2, 1) == 0
+    assert drain(queue) == [first, second]
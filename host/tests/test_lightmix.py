@@ -0,0 +1,70 @@
+from struct import pack
+
+from event_queue import RECORD_FORMAT
+from host.tests import T0
+
+
+def test_catch_up_applies_passed_events(lightmix, clock):
+    lightmix.update()
+    lightmix.add_event("t={}&ce=ff000000&d=100".format(T0 + 100))
+    lightmix.add_event("t={}&ce=00ff0000&d=100".format(T0 + 200))
+    last = lightmix.add_event("t={}&ce=0000ff00&d=100".format(T0 + 300))
+
+    # A single late tick, in the middle of the last event
+    clock.advance(350)
+    lightmix.update()
+    assert lightmix.event.id == last
+    assert len(lightmix.queue) == 0
+    # Fading from the previous event target (green) to blue
+    assert lightmix.values[0] == 0
+    assert 0 < lightmix.values[1] < 1023
+    assert 0 < lightmix.values[2] < 1023
+
+
+def test_catch_up_past_every_event(lightmix, clock):
+    lightmix.update()
+    lightmix.add_event("t={}&ce=ff000000&d=100".format(T0 + 100))
+    lightmix.add_event("t={}&ce=0000ff00&d=100".format(T0 + 200))
+    clock.advance(1000)
+    lightmix.update()
+    assert lightmix.event is None
+    assert list(lightmix.values) == [0, 0, 1023, 0]
+
+
+def test_waits_for_scheduled_event(lightmix, clock):
+    lightmix.update()
+    lightmix.add_event("t={}&ce=ff000000&d=100".format(T0 + 500))
+    clock.advance(100)
+    lightmix.update()
+    assert lightmix.event is None and len(lightmix.queue) == 1
+    assert list(lightmix.values) == [0, 0, 0, 0]
+
+
+def test_horizon(lightmix, clock):
+    lightmix.update()
+    assert lightmix.buffered_until() is None and lightmix.horizon() == 0
+    lightmix.add_event("t={}&ce=ff&d=1000".format(T0 + 500))
+    assert lightmix.buffered_until() == T0 + 1500
+    clock.advance(600)
+    lightmix.update()
+    assert lightmix.horizon() == 900
+
+
+def test_out_of_range_events_rejected(lightmix):
+    for parameters in ("t=99999999999999999999999&ce=ff", "d=99999999999999999999", "d=-1"):
+        try:
+            lightmix.add_event(parameters)
+        except ValueError:
+            continue
+        assert False, parameters
+    assert len(lightmix.queue) == 0
+    assert lightmix.queue._free_count == lightmix.queue.capacity
+
+
+def test_out_of_range_packed_records_rejected(lightmix):
+    records = b"".join(pack(RECORD_FORMAT, start, duration, 0, 0, 0, 0, 255, 0, 0, 0, 0, 4)
+                       for start, duration in ((T0 + 1000, 10), (T0 + 1000, 1 << 31), ((1 << 63) - 1, 10)))
+    queued, rejected, first_id, last_id = lightmix.add_packed_events(records)
+    assert (queued, rejected) == (1, 2)
+    assert first_id == last_id
+    assert len(lightmix.queue) == 1
@@ -0,0 +1,124 @@
+import gc
+import json
+import sys
+from struct import pack
+
+import pytest
+
+import host
+from host.tests import T0
+
+main = pytest.importorskip("main")
+from event_queue import RECORD_FORMAT  # noqa: E402
+
+
+@pytest.fixture
+def panel():
+    main.lightmix.clear()
+    main.lightmix.set_time_offset(T0)
+    main.lightmix.update()
+    max_events = main.admission.max_events
+    yield main
+    main.admission.max_events = max_events
+    main.lightmix.clear()
+
+
+def request(raw):
+    """
+    :return: Tuple (status, headers, content) of the response
+    """
+    client = host.MemorySocket(raw)
+    main.server.handle(client)
+    head, _, content = bytes(client.sent).partition(b"\r\n\r\n")
+    lines = head.decode().split("\r\n")
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, json.loads(content)
+
+
+def addevent(count, start=T0 + 1000):
+    query = "&&".join("t={}&ce=ff&d=10".format(start + i * 10) for i in range(count))
+    return request("GET /addevent?{} HTTP/1.1\r\n\r\n".format(query).encode())
+
+
+def addevents(count, start=T0 + 1000):
+    body = b"".join(pack(RECORD_FORMAT, start + i * 10, 10, 0, 0, 0, 0, 255, 0, 0, 0, 0, 4) for i in range(count))
+    return request(b"POST /addevents HTTP/1.1\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+
+
+def test_admitted_request_reports_capacity(panel):
+    panel.admission.max_events = 10
+    status, _, content = addevent(4)
+    assert status == 202 and content["success"]
+    assert content["depth"] == 4
+    assert content["free_events"] == 6
+    assert content["buffered_until"] == T0 + 1040
+
+
+def test_queue_full_refused_as_a_whole(panel):
+    panel.admission.max_events = 10
+    assert addevents(8)[0] == 202
+    status, headers, content = addevents(3, start=T0 + 5000)
+    assert status == 429
+    assert not content["success"]
+    assert content["free_events"] == 2
+    # One slot is missing : the first queued event frees it when starting
+    assert content["retry_after"] == 1000
+    assert headers["Retry-After"] == "1"
+    assert len(panel.lightmix.queue) == 8
+
+
+def test_larger_than_queue(panel):
+    panel.admission.max_events = 10
+    status, headers, content = addevent(11)
+    assert status == 413
+    assert "Retry-After" not in headers
+    assert len(panel.lightmix.queue) == 0
+
+
+def test_low_memory(panel, monkeypatch):
+    monkeypatch.setattr(gc, "mem_free", lambda: panel.admission.reserve - 1)
+    status, headers, content = addevents(1)
+    assert status == 503
+    assert headers["Retry-After"] == "1"
+    assert content["retry_after"] == panel.admission.retry
+    assert len(panel.lightmix.queue) == 0
+
+
+def test_failed_tick_keeps_queue(panel, monkeypatch):
+    addevent(3)
+    monkeypatch.setattr(sys, "print_exception", lambda error: None)
+
+    def fail(*args):
+        raise RuntimeError("update")
+    monkeypatch.setattr(panel.lightmix, "update", fail)
+    # Next frame, not an idle second
+    assert panel.tick() == 0
+    assert len(panel.lightmix.queue) == 3
+    for _ in range(panel.MAX_FAILURES - 1):
+        panel.tick()
+    assert len(panel.lightmix.queue) == 0
+
+
+def test_out_of_range_event_rejected(panel):
+    query = "t={}&ce=ff&d=10&&t={}&ce=ff&d={}".format(T0 + 1000, T0 + 1000, 1 << 40)
+    status, _, content = request("GET /addevent?{} HTTP/1.1\r\n\r\n".format(query).encode())
+    assert status == 202 and not content["success"]
+    assert content["ids"][0] and content["ids"][1] == 0
+    assert len(panel.lightmix.queue) == 1
+
+
+def test_long_chained_addevent(panel):
+    # Longer than the head buffer : queued while received
+    status, _, content = addevent(60)
+    assert status == 202 and content["success"]
+    assert len(content["ids"]) == 60 and all(content["ids"])
+    assert len(panel.lightmix.queue) == 60
+
+
+def test_long_chained_addevent_fills_queue(panel):
+    panel.admission.max_events = 50
+    status, _, content = addevent(60)
+    assert status == 202 and not content["success"]
+    assert len(content["ids"]) == 60
+    assert 0 < len(panel.lightmix.queue) < 60
+    assert content["ids"].count(0) == 60 - len(panel.lightmix.queue)
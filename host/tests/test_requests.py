@@ -0,0 +1,179 @@
+import asyncio
+import json
+
+import pytest
+
+import host
+from requests import BodyStream, HTTPRequestParser, Response, WebServer
+
+RECORD = 22
+
+
+def collect(buffer_size, pieces):
+    chunks = []
+    stream = BodyStream(bytearray(buffer_size), None, RECORD, lambda request, chunk: chunks.append(bytes(chunk)))
+    for piece in pieces:
+        stream.write(piece)
+    stream.flush()
+    return chunks
+
+
+def test_body_stream_cuts_whole_records():
+    body = bytes(range(5 * RECORD))
+    # Records split across reads, as a network would
+    pieces = [body[:7], body[7:37], body[37:38], body[38:]]
+    chunks = collect(50, pieces)
+    assert [len(chunk) for chunk in chunks] == [44, 44, 22]
+    assert b"".join(chunks) == body
+
+
+def test_body_stream_hands_partial_record_last():
+    body = bytes(range(2 * RECORD + 3))
+    chunks = collect(50, [body[:30], body[30:]])
+    assert [len(chunk) for chunk in chunks] == [44, 3]
+    assert b"".join(chunks) == body
+
+
+def test_body_stream_receives_in_place():
+    chunks = []
+    stream = BodyStream(bytearray(50), None, RECORD, lambda request, chunk: chunks.append(bytes(chunk)))
+    body = bytes(range(3 * RECORD))
+    position = 0
+    while position < len(body):
+        space = stream.space()
+        n = min(len(space), 10, len(body) - position)
+        space[:n] = body[position:position + n]
+        stream.commit(n)
+        position += n
+    stream.flush()
+    assert [len(chunk) for chunk in chunks] == [44, 22]
+    assert b"".join(chunks) == body
+
+
+def test_parser_request_line_and_query():
+    r = HTTPRequestParser(b"GET /addevent?t=5&ce=ff&&d&e= HTTP/1.1\r\nHost: panel\r\n\r\n")
+    assert (r.method, r.path, r.protocol) == ("GET", "/addevent", "HTTP/1.1")
+    assert r.raw_params == "t=5&ce=ff&&d&e="
+    assert r.parameters == [("t", "5"), ("ce", "ff"), ("", ""), ("d", ""), ("e", "")]
+    assert r.params_dict() == {"t": "5", "ce": "ff", "": "", "d": "", "e": ""}
+    assert bytes(r.body) == b""
+
+
+def test_parser_without_query():
+    r = HTTPRequestParser(b"GET /stats HTTP/1.1\r\n\r\n")
+    assert r.path == "/stats"
+    assert r.raw_params is None
+    assert r.params_dict() == {}
+
+
+def test_parser_headers_and_body():
+    r = HTTPRequestParser(b"POST /addevents HTTP/1.1\r\nHost: panel\r\ncontent-length:  4\r\n"
+                          b"X-Broken\r\nConnection: close\r\n\r\nbody")
+    assert r.header("Content-Length") == "4"
+    assert r.header("CONNECTION") == "close"
+    assert r.header("Missing", "default") == "default"
+    assert r.headers == {"Host": "panel", "content-length": "4", "Connection": "close"}
+    assert not r.keep_alive
+    assert bytes(r.body) == b"body"
+
+
+def test_parser_keep_alive_defaults():
+    assert HTTPRequestParser(b"GET / HTTP/1.1\r\n\r\n").keep_alive
+    assert not HTTPRequestParser(b"GET / HTTP/1.0\r\n\r\n").keep_alive
+    assert HTTPRequestParser(b"GET / HTTP/1.0\r\nConnection: Keep-Alive\r\n\r\n").keep_alive
+
+
+def test_parser_rejects_malformed_request_line():
+    with pytest.raises(ValueError):
+        HTTPRequestParser(b"garbage\r\n\r\n")
+
+
+def chained_server(elements):
+    """
+    Server with a small head buffer, whose /chain route collects chained query elements
+    """
+    server = WebServer()
+    server.max_head = 64
+    server.debug = False
+
+    @server.stream_query("/chain")
+    def consume(state, chunk):
+        elements.extend(bytes(chunk).decode().split("&&"))
+        return (state or 0) + 1
+
+    @server.route("/chain")
+    def chain(request):
+        elements.extend(request.raw_params.split("&&"))
+        return Response(content={"chunks": request.state or 0})
+
+    @server.route("/other")
+    def other(request):
+        return Response(content={})
+    return server
+
+
+class Reader:
+    def __init__(self, data, chunk):
+        self.data = data
+        self.chunk = chunk
+
+    async def read(self, size):
+        data = self.data[:min(size, self.chunk)]
+        self.data = self.data[len(data):]
+        return data
+
+
+class Writer:
+    def __init__(self):
+        self.sent = bytearray()
+
+    def get_extra_info(self, name):
+        return None
+
+    def write(self, data):
+        self.sent += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+def handle(server, raw, asynchronous, chunk=10):
+    """
+    :return: bytes | response
+    """
+    if asynchronous:
+        writer = Writer()
+        asyncio.run(server.handle_client(Reader(raw, chunk), writer))
+        return bytes(writer.sent)
+    client = host.MemorySocket(raw, chunk)
+    server.handle(client)
+    return bytes(client.sent)
+
+
+@pytest.mark.parametrize("asynchronous", (False, True))
+def test_long_chained_query_streamed(asynchronous):
+    elements = []
+    server = chained_server(elements)
+    query = "&&".join("e={}&d=10".format(i) for i in range(40))
+    response = handle(server, "GET /chain?{} HTTP/1.1\r\nConnection: close\r\n\r\n".format(query).encode(),
+                      asynchronous)
+    assert response.startswith(b"HTTP/1.1 200")
+    assert elements == query.split("&&")
+    # Head buffer cut several times
+    assert json.loads(response.partition(b"\r\n\r\n")[2])["chunks"] > 1
+
+
+@pytest.mark.parametrize("asynchronous", (False, True))
+def test_long_head_refused(asynchronous):
+    server = chained_server([])
+    query = "&&".join("e={}&d=10".format(i) for i in range(40))
+    for raw in ("GET /other?{} HTTP/1.1\r\n\r\n".format(query),
+                "GET /chain?e=1 HTTP/1.1\r\nX-Long: {}\r\n\r\n".format("x" * 100),
+                "GET /chain?{} HTTP/1.1\r\n\r\n".format("e" * 100)):
+        assert handle(server, raw.encode(), asynchronous).startswith(b"HTTP/1.1 431")
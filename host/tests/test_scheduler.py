@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from scheduler import TickScheduler
+
+PERIOD = 20000
+
+
+class Stop(Exception):
+    pass
+
+
+def run(clock, monkeypatch, plan, wakes=()):
+    """
+    Runs the blocking tick loop on the virtual clock
+    :plan: List | values returned by the callback, one per tick
+    :wakes: List | times of wake() calls, in microseconds from the start
+    :return: Tuple (scheduler, list of tick times from the start)
+    """
+    start = clock.us()
+    times = []
+    wakes = list(wakes)
+
+    def callback():
+        times.append(clock.us() - start)
+        if len(times) > len(plan):
+            raise Stop
+        return plan[len(times) - 1]
+    scheduler = TickScheduler(callback, rate=1000000 // PERIOD)
+
+    def sleep_us(us):
+        clock.sleep_us(us)
+        while wakes and clock.us() - start >= wakes[0]:
+            wakes.pop(0)
+            scheduler.wake()
+    monkeypatch.setattr(time, "sleep_us", sleep_us)
+    with pytest.raises(Stop):
+        scheduler.run()
+    return scheduler, times
+
+
+def test_wake_cuts_idle_sleep_on_the_grid(clock, monkeypatch):
+    # Idle second, cut short mid frame
+    scheduler, times = run(clock, monkeypatch, [None, 0], wakes=[10 * PERIOD + 5000])
+    assert times == [0, 11 * PERIOD, 12 * PERIOD]
+    assert scheduler.idle == 10
+
+
+def test_wake_keeps_next_frame(clock, monkeypatch):
+    # Commands while ticking every frame don't move the deadline
+    wakes = [PERIOD // 2, PERIOD + 1000, 2 * PERIOD + PERIOD - 1]
+    scheduler, times = run(clock, monkeypatch, [0, 0, 0], wakes=wakes)
+    assert times == [0, PERIOD, 2 * PERIOD, 3 * PERIOD]
+    assert scheduler.idle == 0
+
+
+def test_wakes_stay_on_the_grid(clock, monkeypatch):
+    wakes = [3 * PERIOD + 1, 5 * PERIOD + 7000, 40 * PERIOD + 19999]
+    scheduler, times = run(clock, monkeypatch, [None, None, 60, None], wakes=wakes)
+    assert all(t % PERIOD == 0 for t in times)
+    assert times == [0, 4 * PERIOD, 6 * PERIOD, 9 * PERIOD, 41 * PERIOD]
+    # Frames neither ticked nor skipped
+    assert scheduler.idle == 41 - 4
+    assert scheduler.skipped == 0
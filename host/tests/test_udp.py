@@ -0,0 +1,58 @@
+from struct import pack
+
+from udp import UDPServer, MAGIC, VERSION, SECTION_FORMAT, ALL_PANELS
+
+COMMAND = 9
+
+
+def datagram(*sections):
+    """
+    :sections: Tuples (panel, groups, payload)
+    """
+    return MAGIC + bytes([VERSION]) + b"".join(
+        pack(SECTION_FORMAT, COMMAND, panel, groups, len(payload)) + payload for panel, groups, payload in sections)
+
+
+def server(panel=3, groups=0b0101):
+    received = []
+    udp = UDPServer(panel=panel, groups=groups)
+    udp.command(COMMAND)(lambda payload: received.append(bytes(payload)))
+    return udp, received
+
+
+def test_sections_addressed_to_panel():
+    udp, received = server()
+    executed = udp.handle(datagram(
+        (3, 0, b"own"),
+        (4, 0, b"other panel"),
+        # Panel ids ignore groups
+        (3, 0b1000, b"own, any group"),
+        (ALL_PANELS, 0, b"every panel"),
+        (ALL_PANELS, 0b0100, b"own group"),
+        (ALL_PANELS, 0b1010, b"other groups"),
+    ))
+    assert executed == 4
+    assert received == [b"own", b"own, any group", b"every panel", b"own group"]
+
+
+def test_panel_without_id():
+    udp, received = server(panel=None, groups=0)
+    assert udp.handle(datagram((0, 0, b"panel 0"), (ALL_PANELS, 0b1, b"group"), (ALL_PANELS, 0, b"all"))) == 1
+    assert received == [b"all"]
+
+
+def test_payloads_follow_lengths():
+    udp, received = server()
+    udp.handle(datagram((3, 0, b""), (3, 0, bytes(300)), (3, 0, b"last")))
+    assert received == [b"", bytes(300), b"last"]
+
+
+def test_unknown_datagrams_ignored():
+    udp, received = server()
+    sections = datagram((3, 0, b"own"))
+    assert udp.handle(b"XX" + sections[2:]) == 0
+    assert udp.handle(MAGIC + bytes([VERSION + 1]) + sections[3:]) == 0
+    assert udp.handle(MAGIC) == 0
+    # Unregistered commands are skipped
+    assert udp.handle(sections.replace(bytes([COMMAND]), bytes([COMMAND + 1]), 1)) == 0
+    assert received == []
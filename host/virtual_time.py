@@ -0,0 +1,63 @@
+import time
+
+# MicroPython ticks wrap at 2^30 on the ESP32
+TICKS_PERIOD = 1 << 30
+TICKS_MASK = TICKS_PERIOD - 1
+TICKS_HALF = TICKS_PERIOD >> 1
+
+
+class VirtualClock:
+    def __init__(self, realtime=False, start_us=0):
+        """
+        Clock behind the time.ticks_* stand-ins.
+        Virtual clocks only move with advance() and sleeps, so runs are reproducible.
+        Realtime clocks follow time.perf_counter, advance() adding an extra offset.
+
+        :realtime: Boolean | follow the host clock
+        :start_us: Int | initial time, in microseconds. Set close to TICKS_PERIOD to test wrapping
+        """
+        self.realtime = realtime
+        self._offset = start_us
+        self._origin = time.perf_counter_ns()
+
+    def us(self):
+        """
+        Unwrapped time, in microseconds
+        """
+        if self.realtime:
+            return self._offset + (time.perf_counter_ns() - self._origin) // 1000
+        return self._offset
+
+    def advance(self, ms=0, us=0):
+        """
+        Moves the clock forward
+        """
+        self._offset += ms * 1000 + us
+
+    def ticks_ms(self):
+        return (self.us() // 1000) & TICKS_MASK
+
+    def ticks_us(self):
+        return self.us() & TICKS_MASK
+
+    def ticks_cpu(self):
+        return self.ticks_us()
+
+    @staticmethod
+    def ticks_diff(a, b):
+        return ((a - b + TICKS_HALF) & TICKS_MASK) - TICKS_HALF
+
+    @staticmethod
+    def ticks_add(ticks, delta):
+        return (ticks + delta) & TICKS_MASK
+
+    def sleep_ms(self, ms):
+        self.sleep_us(ms * 1000)
+
+    def sleep_us(self, us):
+        if us <= 0:
+            return
+        if self.realtime:
+            time.sleep(us / 1000000)
+        else:
+            self.advance(us=us)